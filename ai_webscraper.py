@@ -1,15 +1,36 @@
 import streamlit as st
 from serpapi import GoogleSearch
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, SoupStrainer
 import re
 import pandas as pd
-from datetime import datetime
 import datetime as dt
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, OperationFailure
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import PyMongoError
 import os
+import json
+import math
+import hashlib
+import heapq
+import threading
+import time
+from bson import ObjectId
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse, urldefrag
+from urllib.robotparser import RobotFileParser
 from dotenv import load_dotenv
+from disk_cache import DiskCache
+from contact_fields import LIST_FIELDS, ALL_EMAILS_FIELD, PERSONAL_EMAIL_DOMAINS, contact_list_fields
+from contact_dedupe import is_shared_domain, resolve_pending_contacts
+from database import get_db, flush_bulk, new_write_summary
+
+try:
+    import lxml  # noqa: F401 -- optional, much faster than html.parser
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
 
 load_dotenv()
 
@@ -17,93 +38,359 @@ load_dotenv()
 # CONFIGURATION
 # ===============================
 SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 
 RAW_SCRAPED_COLLECTION = "scraped_contacts"
 CLEANED_COLLECTION_NAME = "cleaned_contacts"
+SCRAPE_JOBS_COLLECTION = "scrape_jobs"
+MONGO_BATCH_SIZE = 500
+JOB_POLL_SECONDS = 3
+# Known websites scraped more recently than this are skipped; older ones are re-scraped
+SCRAPE_REFRESH_DAYS = int(os.getenv("SCRAPE_REFRESH_DAYS", 30))
 
 EMAIL_REGEX = r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+"
 PHONE_REGEX = r"\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}"
+EMAIL_PATTERN = re.compile(EMAIL_REGEX)
+PHONE_PATTERN = re.compile(PHONE_REGEX)
+ANCHOR_STRAINER = SoupStrainer("a", href=True)
+
+# Bodies are streamed and cut off at this size; non-HTML responses are not downloaded
+MAX_PAGE_BYTES = int(os.getenv("SCRAPER_MAX_PAGE_KB", 1024)) * 1024
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+HTTP_HEADERS = {"User-Agent": "Mozilla/5.0"}
+REQUEST_TIMEOUT = 10
+
+# SerpAPI results are cached per (query, num, page) so repeated searches cost no credits
+SERP_CACHE_TTL = int(os.getenv("SERP_CACHE_TTL_SECONDS", 24 * 3600))
+SERP_PAGE_SIZE = 100  # Largest page Google returns per request
+SERP_MAX_CONCURRENT_PAGES = 5
+MAX_SEARCH_RESULTS = 500
+
+# On-disk response cache for scraped pages, plus parse results keyed by content hash
+SCRAPER_CACHE_DIR = os.getenv("SCRAPER_CACHE_DIR", ".cache/scraper")
+SCRAPER_CACHE_TTL = int(os.getenv("SCRAPER_CACHE_TTL_SECONDS", 24 * 3600))
+SCRAPER_CACHE_MAX_BYTES = int(os.getenv("SCRAPER_CACHE_MAX_MB", 200)) * 1024 * 1024
+
+HTTP_CACHE = DiskCache(os.path.join(SCRAPER_CACHE_DIR, "http"), SCRAPER_CACHE_TTL, SCRAPER_CACHE_MAX_BYTES)
+SERP_CACHE = DiskCache(os.path.join(SCRAPER_CACHE_DIR, "serpapi"), SERP_CACHE_TTL, SCRAPER_CACHE_MAX_BYTES // 4)
+PARSE_CACHE = DiskCache(os.path.join(SCRAPER_CACHE_DIR, "parsed"), SCRAPER_CACHE_TTL * 7, SCRAPER_CACHE_MAX_BYTES // 4)
+
+# Crawl engine limits: total sites fetched at once, and at once per host
+MAX_CONCURRENT_SITES = int(os.getenv("SCRAPER_MAX_CONCURRENCY", 10))
+MAX_CONCURRENT_PER_HOST = int(os.getenv("SCRAPER_MAX_PER_HOST", 2))
+
+# Per-site crawl: pages are fetched best-first by link score and the crawl stops
+# as soon as CRAWL_TARGET_EMAILS emails are found
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", 2))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", 6))
+CRAWL_TARGET_EMAILS = int(os.getenv("CRAWL_TARGET_EMAILS", 3))
+CRAWL_HOST_DELAY = float(os.getenv("CRAWL_HOST_DELAY_SECONDS", 0.5))
+CRAWL_MAX_HOST_DELAY = 5.0  # Upper bound on a robots.txt Crawl-delay we are willing to honour
+ROBOTS_CACHE_TTL = int(os.getenv("ROBOTS_CACHE_TTL_SECONDS", 24 * 3600))
+HOST_STATE_PRUNE_SIZE = 1024  # The worker runs for days; expired per-host entries are dropped past this size
+CONTACT_LINK_KEYWORDS = {
+    "contact": 10, "kontakt": 10, "impressum": 8, "reach-us": 8, "get-in-touch": 8,
+    "about": 6, "team": 5, "people": 4, "staff": 4, "leadership": 4,
+    "company": 2, "support": 2, "office": 2, "locations": 2
+}
 
-PERSONAL_EMAIL_DOMAINS = [
-    "gmail.com", "yahoo.com", "hotmail.com", "outlook.com", "aol.com",
-    "icloud.com", "protonmail.com", "zoho.com", "gmx.com"
-]
 
 # ===============================
 # FUNCTIONS
 # ===============================
-def get_db_connection():
-    try:
-        client = MongoClient(MONGO_URI)
-        client.admin.command('ismaster')
-        db = client[MONGO_DB_NAME]
-        return client, db
-    except ConnectionFailure as e:
-        st.error(f"❌ **Database Connection Error:** {e}")
-        return None, None
+def fetch_search_page(query, num, page):
+    """Fetches one page of organic results, served from SERP_CACHE while fresh."""
+    key = json.dumps([query.strip().lower(), num, page])
+    cached = SERP_CACHE.get(key)
+    if cached is not None:
+        return cached
+    params = {"q": query, "api_key": SERPAPI_API_KEY, "num": num, "start": page * num}
+    response = GoogleSearch(params).get_dict()
+    results = response.get("organic_results", [])
+    parsed = [{"title": r.get("title"), "url": r.get("link"), "snippet": r.get("snippet")} for r in results]
+    if "error" not in response:
+        SERP_CACHE.set(key, parsed)
+    return parsed
 
 def google_search(query, num_results=5):
-    params = {"q": query, "api_key": SERPAPI_API_KEY, "num": num_results}
-    search = GoogleSearch(params)
-    results = search.get_dict().get("organic_results", [])
-    return [{"title": r.get("title"), "url": r.get("link"), "snippet": r.get("snippet")} for r in results]
-
-def find_contact_page(website_url):
+    """Fetches as many result pages as needed concurrently and de-duplicates them by URL."""
+    page_size = min(num_results, SERP_PAGE_SIZE)
+    page_count = math.ceil(num_results / page_size)
+    with ThreadPoolExecutor(max_workers=min(page_count, SERP_MAX_CONCURRENT_PAGES)) as executor:
+        pages = list(executor.map(lambda page: fetch_search_page(query, page_size, page), range(page_count)))
+
+    seen_urls, results = set(), []
+    for page_results in pages:
+        for result in page_results:
+            url_key = (result.get("url") or "").rstrip('/').lower()
+            if url_key and url_key in seen_urls:
+                continue
+            seen_urls.add(url_key)
+            results.append(result)
+    return results[:num_results]
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    """Returns the process-wide keep-alive session shared by all crawl threads."""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            session.headers.update(HTTP_HEADERS)
+            adapter = HTTPAdapter(pool_connections=max(MAX_CONCURRENT_SITES * 2, 10), pool_maxsize=MAX_CONCURRENT_PER_HOST)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _http_session = session
+        return _http_session
+
+def read_html_body(resp):
+    """
+    Streams a response body up to MAX_PAGE_BYTES. Returns "" without reading the body
+    when the content type is not HTML (PDFs, images, ...).
+    """
+    content_type = resp.headers.get("Content-Type", "text/html").split(";")[0].strip().lower()
+    if content_type not in HTML_CONTENT_TYPES:
+        resp.close()
+        return ""
+    chunks, size = [], 0
+    for chunk in resp.iter_content(chunk_size=64 * 1024):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= MAX_PAGE_BYTES:
+            break
+    resp.close()
+    return b"".join(chunks)[:MAX_PAGE_BYTES].decode(resp.encoding or "utf-8", errors="replace")
+
+_robots_cache = {}
+_robots_lock = threading.Lock()
+_host_next_slot = {}
+_host_slot_lock = threading.Lock()
+
+def site_root(url):
+    parts = urlparse(url)
+    return f"{parts.scheme}://{parts.netloc.lower()}"
+
+def same_site(url_a, url_b):
+    host_a = urlparse(url_a).netloc.lower().removeprefix("www.")
+    host_b = urlparse(url_b).netloc.lower().removeprefix("www.")
+    return host_a == host_b
+
+def get_robots(url):
+    """Returns the parsed robots.txt for the URL's host, re-fetched once ROBOTS_CACHE_TTL has passed."""
+    root = site_root(url)
+    with _robots_lock:
+        cached = _robots_cache.get(root)
+        if cached and time.monotonic() - cached[0] < ROBOTS_CACHE_TTL:
+            return cached[1]
+    robots = RobotFileParser(root + "/robots.txt")
     try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        resp = requests.get(website_url, headers=headers, timeout=10)
-        soup = BeautifulSoup(resp.text, "html.parser")
-        for a in soup.find_all("a", href=True):
-            href_text = a.get_text(strip=True).lower()
-            href_url = a["href"].lower()
-            if "contact" in href_url or "contact" in href_text:
-                return requests.compat.urljoin(website_url, a["href"])
+        resp = get_http_session().get(root + "/robots.txt", timeout=REQUEST_TIMEOUT)
+        if resp.status_code in (401, 403):
+            robots.disallow_all = True
+        elif resp.ok:
+            robots.parse(resp.text.splitlines())
+        else:
+            robots.allow_all = True
     except requests.exceptions.RequestException:
-        pass
-    return website_url
-
-def scrape_contact_page(contact_url):
-    emails, phones = [], []
-    if not contact_url:
-        return {"emails": [], "phones": []}
+        robots.allow_all = True
+    with _robots_lock:
+        now = time.monotonic()
+        if len(_robots_cache) >= HOST_STATE_PRUNE_SIZE:
+            for host, (fetched_at, _) in list(_robots_cache.items()):
+                if now - fetched_at >= ROBOTS_CACHE_TTL:
+                    del _robots_cache[host]
+        _robots_cache[root] = (now, robots)
+    return robots
+
+def is_allowed(url):
+    return get_robots(url).can_fetch(HTTP_HEADERS["User-Agent"], url)
+
+def wait_for_host(url):
+    """Sleeps until this host's next politeness slot, honouring a robots.txt Crawl-delay."""
+    crawl_delay = get_robots(url).crawl_delay(HTTP_HEADERS["User-Agent"])
+    delay = min(max(CRAWL_HOST_DELAY, float(crawl_delay or 0)), CRAWL_MAX_HOST_DELAY)
+    root = site_root(url)
+    with _host_slot_lock:
+        now = time.monotonic()
+        if len(_host_next_slot) >= HOST_STATE_PRUNE_SIZE:
+            # A slot in the past no longer delays anyone, so dropping it changes nothing
+            for host, next_slot in list(_host_next_slot.items()):
+                if next_slot <= now:
+                    del _host_next_slot[host]
+        slot = max(now, _host_next_slot.get(root, now))
+        _host_next_slot[root] = slot + delay
+    if slot > now:
+        time.sleep(slot - now)
+
+def fetch_page(url):
+    """
+    Downloads a page over the pooled session, served from HTTP_CACHE while fresh and
+    revalidated with ETag/Last-Modified once stale. Returns (final_url, html); html is
+    None on failure and "" for non-HTML content.
+    """
+    entry = HTTP_CACHE.get_entry(url)
+    if entry is not None and HTTP_CACHE.is_fresh(entry):
+        HTTP_CACHE.record("hits")
+        return entry["value"]["url"], entry["value"]["html"]
+
+    wait_for_host(url)
+    headers = {}
+    if entry is not None:
+        if entry["value"].get("etag"):
+            headers["If-None-Match"] = entry["value"]["etag"]
+        if entry["value"].get("last_modified"):
+            headers["If-Modified-Since"] = entry["value"]["last_modified"]
     try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        resp = requests.get(contact_url, headers=headers, timeout=10)
-        text = resp.text
-        emails = list(set(re.findall(EMAIL_REGEX, text)))
-        phones = list(set(re.findall(PHONE_REGEX, text)))
+        resp = get_http_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT, stream=True)
+        if resp.status_code == 304 and entry is not None:
+            resp.close()
+            HTTP_CACHE.record("revalidated")
+            HTTP_CACHE.set(url, entry["value"])
+            return entry["value"]["url"], entry["value"]["html"]
+        html = read_html_body(resp)
     except requests.exceptions.RequestException:
-        pass
-    return {"emails": emails, "phones": phones}
+        return url, None
 
-def save_to_raw_scraped_log(db, data):
-    try:
-        db[RAW_SCRAPED_COLLECTION].insert_one(data)
-    except Exception as e:
-        st.error(f"❌ Error saving to raw scrape log: {e}")
-
-def save_to_cleaned_mongo(db, dict_data):
-    source_url = dict_data.get("source_url")
-    if not source_url:
-        st.warning(f"⚠️ Skipped saving '{dict_data.get('name', 'Unknown')}' to cleaned contacts: Source URL is missing.")
-        return
-    try:
-        result = db[CLEANED_COLLECTION_NAME].update_one(
-            {'source_url': source_url},
-            {'$setOnInsert': dict_data},
-            upsert=True
-        )
-        if result.upserted_id:
-            st.success(f"✅ Added new unique contact '{dict_data.get('name')}' to cleaned data.")
-        else:
-            st.info(f"ℹ️ Contact '{dict_data.get('name')}' already exists (duplicate source URL).")
-    except Exception as e:
-        st.error(f"❌ Error during cleaned save operation: {e}")
+    HTTP_CACHE.record("misses")
+    if resp.ok:
+        HTTP_CACHE.set(url, {
+            "url": resp.url, "html": html,
+            "etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")
+        })
+    return resp.url, html
+
+def extract_contacts(*pages):
+    """Collects the unique emails and phone numbers found across the given page bodies."""
+    emails, phones = set(), set()
+    for text in pages:
+        if text:
+            emails.update(EMAIL_PATTERN.findall(text))
+            phones.update(PHONE_PATTERN.findall(text))
+    return {"emails": list(emails), "phones": list(phones)}
+
+def score_link(href, text):
+    """Scores how likely a link is to lead to contact details; 0 means not worth crawling."""
+    if href.lower().startswith(("mailto:", "tel:", "javascript:", "#")):
+        return 0
+    haystack = f"{href} {text}".lower()
+    return max((weight for keyword, weight in CONTACT_LINK_KEYWORDS.items() if keyword in haystack), default=0)
+
+def rank_links(html):
+    """Returns [score, href] pairs for the page's promising links, best first."""
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=ANCHOR_STRAINER)
+    ranked = []
+    for a in soup.find_all("a", href=True):
+        score = score_link(a["href"], a.get_text(strip=True))
+        if score:
+            ranked.append([score, a["href"]])
+    ranked.sort(key=lambda link: -link[0])
+    return ranked
+
+def parse_page(html):
+    """Parses a body for ranked links and contacts, skipped when the same content was parsed before."""
+    content_hash = "v2:" + hashlib.sha256(html.encode("utf-8", "ignore")).hexdigest()
+    parsed = PARSE_CACHE.get(content_hash)
+    if parsed is None:
+        parsed = {"links": rank_links(html), **extract_contacts(html)}
+        PARSE_CACHE.set(content_hash, parsed)
+    return parsed
+
+def crawl_domain(website_url, max_depth=CRAWL_MAX_DEPTH, max_pages=CRAWL_MAX_PAGES, target_emails=CRAWL_TARGET_EMAILS):
+    """
+    Bounded best-first crawl of one site, starting at its homepage. Same-site links are
+    queued by score (contact > about > team ...) then depth, robots.txt is respected,
+    no page is fetched twice, and the crawl stops once `target_emails` are found.
+    """
+    emails, phones = set(), set()
+    queue = [(0, 0, 0, website_url)]  # (-score, depth, sequence, url)
+    seen = {website_url.rstrip('/').lower()}
+    sequence = fetched = 0
+    while queue and fetched < max_pages:
+        _, depth, _, url = heapq.heappop(queue)
+        if not is_allowed(url):
+            continue
+        final_url, html = fetch_page(url)
+        fetched += 1
+        seen.add(final_url.rstrip('/').lower())
+        if not html:
+            continue
+        parsed = parse_page(html)
+        emails.update(parsed["emails"])
+        phones.update(parsed["phones"])
+        if len(emails) >= target_emails:
+            break
+        if depth >= max_depth:
+            continue
+        for score, href in parsed["links"]:
+            link = urldefrag(requests.compat.urljoin(final_url, href))[0]
+            key = link.rstrip('/').lower()
+            if key in seen or not link.startswith("http") or not same_site(link, website_url):
+                continue
+            seen.add(key)
+            sequence += 1
+            heapq.heappush(queue, (-score, depth + 1, sequence, link))
+    return {"emails": list(emails), "phones": list(phones)}
+
+def scrape_site(item, host_slots):
+    """Crawls one search result for contacts, respecting the per-host cap."""
+    website = item.get("url")
+    with host_slots(website):
+        item["contact_info"] = crawl_domain(website)
+    return item
+
+def crawl_sites(results, max_workers=MAX_CONCURRENT_SITES, per_host=MAX_CONCURRENT_PER_HOST, on_progress=None):
+    """
+    Scrapes all results concurrently on a thread pool. `on_progress(done, total, item)` is
+    called from the calling thread as each site finishes; the returned items keep the
+    search result order and carry the `contact_info` used by process_and_save_results.
+    """
+    items = [item for item in results if item.get("url")]
+    if not items:
+        return []
+
+    semaphores = defaultdict(lambda: threading.BoundedSemaphore(per_host))
+    semaphores_lock = threading.Lock()
+
+    def host_slots(url):
+        host = urlparse(url).netloc.lower()
+        with semaphores_lock:
+            return semaphores[host]
+
+    scraped = [None] * len(items)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        futures = {executor.submit(scrape_site, item, host_slots): i for i, item in enumerate(items)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            try:
+                scraped[i] = future.result()
+            except Exception:
+                items[i]["contact_info"] = {"emails": [], "phones": []}
+                scraped[i] = items[i]
+            if on_progress:
+                on_progress(done, len(items), scraped[i])
+    return scraped
+
+def display_row(item):
+    contact_info = item.get("contact_info", {})
+    all_emails = contact_info.get("emails", [])
+    return {
+        "Company Name": item.get("title", ""), "Website URL": (item.get("url") or "").rstrip('/'),
+        "Work Emails": ", ".join(email for email in all_emails if email.split('@')[-1] not in PERSONAL_EMAIL_DOMAINS),
+        "Personal Emails": ", ".join(email for email in all_emails if email.split('@')[-1] in PERSONAL_EMAIL_DOMAINS),
+        "Phones": ", ".join(contact_info.get("phones", []))
+    }
 
 def process_and_save_results(results, query, db):
+    """
+    Logs every result to the raw collection and upserts it into cleaned contacts, buffered
+    into unordered bulk writes of MONGO_BATCH_SIZE. Returns (display DataFrame, summary counts).
+    """
     rows_for_display = []
+    raw_ops, cleaned_ops, refresh_ops = [], [], []
+    seen_source_urls = set()
+    summary = new_write_summary("refreshed", "skipped")
     for item in results:
         contact_info = item.get("contact_info", {})
         all_emails = contact_info.get("emails", [])
@@ -112,32 +399,245 @@ def process_and_save_results(results, query, db):
         work_emails = [email for email in all_emails if email.split('@')[-1] not in PERSONAL_EMAIL_DOMAINS]
         personal_emails = [email for email in all_emails if email.split('@')[-1] in PERSONAL_EMAIL_DOMAINS]
 
-        raw_scrape_data = {
+        raw_ops.append(InsertOne({
             "query": query, "company_name": item.get("title", ""), "website_url": website_url,
             "snippet": item.get("snippet", ""), "scraped_emails": all_emails,
             "scraped_phones": contact_info.get("phones", []), "scraped_at": dt.datetime.now(dt.timezone.utc)
-        }
-        save_to_raw_scraped_log(db, raw_scrape_data)
+        }))
 
         cleaned_data = {
             "name": item.get("title", ""),
             "source_url": website_url,
-            "work_emails": ", ".join(work_emails),
-            "personal_emails": ", ".join(personal_emails),
-            "phones": ", ".join(contact_info.get("phones", [])),
+            **contact_list_fields(work_emails, personal_emails, contact_info.get("phones", [])),
             "domain": website_url.split('/')[2] if website_url else None,
             "source": "Web Scraper",
             "created_at": dt.datetime.now(dt.timezone.utc)
         }
-        save_to_cleaned_mongo(db, cleaned_data)
+        if not website_url:
+            summary["skipped"] += 1
+        elif website_url in seen_source_urls:
+            summary["duplicates"] += 1
+        elif item.get("refresh"):
+            # Stale known site: overwrite its contact fields instead of keeping the old ones
+            seen_source_urls.add(website_url)
+            refreshed_fields = {field: cleaned_data.pop(field) for field in LIST_FIELDS + (ALL_EMAILS_FIELD,)}
+            refreshed_fields["refreshed_at"] = dt.datetime.now(dt.timezone.utc)
+            # Dropping the blocking keys queues the record for de-duplication with its new emails
+            refresh_ops.append(UpdateOne(
+                {'source_url': website_url},
+                {'$set': refreshed_fields, '$unset': {'block_keys': ""}, '$setOnInsert': cleaned_data},
+                upsert=True
+            ))
+        else:
+            seen_source_urls.add(website_url)
+            cleaned_ops.append(UpdateOne({'source_url': website_url}, {'$setOnInsert': cleaned_data}, upsert=True))
+
+        if len(raw_ops) >= MONGO_BATCH_SIZE:
+            flush_bulk(db[RAW_SCRAPED_COLLECTION], raw_ops, summary)
+        if len(cleaned_ops) >= MONGO_BATCH_SIZE:
+            flush_bulk(db[CLEANED_COLLECTION_NAME], cleaned_ops, summary)
+        if len(refresh_ops) >= MONGO_BATCH_SIZE:
+            flush_bulk(db[CLEANED_COLLECTION_NAME], refresh_ops, summary, matched_key="refreshed")
+
+        rows_for_display.append(display_row(item))
+    flush_bulk(db[RAW_SCRAPED_COLLECTION], raw_ops, summary)
+    flush_bulk(db[CLEANED_COLLECTION_NAME], cleaned_ops, summary)
+    flush_bulk(db[CLEANED_COLLECTION_NAME], refresh_ops, summary, matched_key="refreshed")
+    try:
+        resolve_pending_contacts(db)
+    except PyMongoError as error:
+        summary["errors"] += 1
+        summary["error_messages"].append(f"de-duplication failed: {error}")
+    return pd.DataFrame(rows_for_display), summary
+
+def show_save_summary(summary):
+    st.success(f"✅ Logged {summary['raw_logged']} raw results. Added {summary['inserted']} new unique contacts; "
+               f"{summary['duplicates']} already existed (duplicate source URL).")
+    if summary.get("refreshed"):
+        st.info(f"🔄 Refreshed {summary['refreshed']} stale contact(s) with newly scraped details.")
+    if summary["skipped"]:
+        st.warning(f"⚠️ Skipped {summary['skipped']} result(s) without a source URL.")
+    if summary["errors"]:
+        st.error(f"❌ {summary['errors']} write(s) failed: {'; '.join(summary['error_messages'][:3])}")
+
+def classify_known_sites(db, results, refresh_after_days=SCRAPE_REFRESH_DAYS):
+    """
+    Looks up every result URL and domain in cleaned_contacts with one indexed $in query
+    before anything is fetched. Returns {source_url: "fresh" | "stale"} for the results
+    already known, judged by when their contact was last scraped. Pages on shared hosts
+    (yelp.com/biz/a, facebook.com/acme) are matched by URL only, never by domain.
+    """
+    candidates = {}
+    for item in results:
+        source_url = (item.get("url") or "").rstrip('/')
+        if source_url:
+            domain = urlparse(source_url).netloc.lower().removeprefix("www.")
+            candidates[source_url] = None if is_shared_domain(domain) else domain
+    if not candidates:
+        return {}
+
+    domains = set()
+    for domain in candidates.values():
+        if domain:
+            domains.update({domain, f"www.{domain}"})
+    cursor = db[CLEANED_COLLECTION_NAME].find(
+        {"$or": [{"source_url": {"$in": list(candidates)}}, {"domain": {"$in": list(domains)}}]},
+        {"source_url": 1, "domain": 1, "created_at": 1, "refreshed_at": 1}
+    )
+    last_seen = {}
+    for doc in cursor:
+        seen_at = doc.get("refreshed_at") or doc.get("created_at")
+        if not seen_at:
+            continue
+        seen_at = seen_at.replace(tzinfo=None)
+        domain = (doc.get("domain") or "").lower().removeprefix("www.")
+        for key in (doc.get("source_url"), None if is_shared_domain(domain) else domain):
+            if key:
+                last_seen[key] = max(last_seen.get(key, seen_at), seen_at)
+
+    cutoff = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None) - dt.timedelta(days=refresh_after_days)
+    known = {}
+    for source_url, domain in candidates.items():
+        seen_times = [t for t in (last_seen.get(source_url), last_seen.get(domain)) if t]
+        if seen_times:
+            known[source_url] = "fresh" if max(seen_times) >= cutoff else "stale"
+    return known
 
-        rows_for_display.append({
-            "Company Name": item.get("title", ""), "Website URL": website_url,
-            "Work Emails": ", ".join(work_emails),
-            "Personal Emails": ", ".join(personal_emails),
-            "Phones": ", ".join(contact_info.get("phones", []))
+# ===============================
+# BACKGROUND SCRAPE JOBS
+# ===============================
+def submit_scrape_job(db, query, num_results, refresh_after_days=SCRAPE_REFRESH_DAYS):
+    """Queues a scrape for scrape_worker.py and returns the new job id as a string."""
+    job = {
+        "query": query, "num_results": num_results, "refresh_after_days": refresh_after_days, "status": "queued",
+        "total": None, "done": 0, "results": [],
+        "created_at": dt.datetime.now(dt.timezone.utc)
+    }
+    return str(db[SCRAPE_JOBS_COLLECTION].insert_one(job).inserted_id)
+
+def fetch_scrape_job(db, job_id):
+    return db[SCRAPE_JOBS_COLLECTION].find_one({"_id": ObjectId(job_id)})
+
+def fetch_recent_scrape_jobs(db, limit=10):
+    projection = {"query": 1, "status": 1, "created_at": 1}
+    return list(db[SCRAPE_JOBS_COLLECTION].find({}, projection).sort("created_at", -1).limit(limit))
+
+def run_scrape_job(db, job):
+    """
+    Runs a claimed job end to end: search, concurrent crawl and bulk save. Each finished
+    site is pushed onto the job document so the UI can show partial results.
+    """
+    jobs = db[SCRAPE_JOBS_COLLECTION]
+    job_id = job["_id"]
+    SERP_CACHE.reset_stats()
+    HTTP_CACHE.reset_stats()
+
+    results = google_search(job["query"], num_results=job["num_results"])
+    missing_urls = [item.get("title", "N/A") for item in results if not item.get("url")]
+    known = classify_known_sites(db, results, job.get("refresh_after_days", SCRAPE_REFRESH_DAYS))
+    known_skipped = []
+    to_crawl = []
+    for item in results:
+        status = known.get((item.get("url") or "").rstrip('/'))
+        if status == "fresh":
+            known_skipped.append(item.get("url"))
+            continue
+        if status == "stale":
+            item["refresh"] = True
+        to_crawl.append(item)
+    jobs.update_one({"_id": job_id}, {"$set": {
+        "total": len(to_crawl) - len(missing_urls), "missing_urls": missing_urls,
+        "known_skipped": known_skipped, "heartbeat_at": dt.datetime.now(dt.timezone.utc)
+    }})
+
+    def record_progress(done, total, item):
+        jobs.update_one({"_id": job_id}, {
+            "$push": {"results": item},
+            "$set": {"done": done, "heartbeat_at": dt.datetime.now(dt.timezone.utc)}
         })
-    return pd.DataFrame(rows_for_display)
+
+    scraped_data_list = crawl_sites(to_crawl, on_progress=record_progress)
+    _, summary = process_and_save_results(scraped_data_list, job["query"], db)
+    jobs.update_one({"_id": job_id}, {"$set": {
+        "status": "completed", "summary": summary,
+        "cache_stats": {
+            "serp_hits": SERP_CACHE.stats["hits"], "serp_misses": SERP_CACHE.stats["misses"],
+            "http_hits": HTTP_CACHE.stats["hits"], "http_revalidated": HTTP_CACHE.stats["revalidated"],
+            "http_misses": HTTP_CACHE.stats["misses"]
+        },
+        "finished_at": dt.datetime.now(dt.timezone.utc)
+    }})
+
+def show_scrape_job(job):
+    status = job["status"]
+    total, done = job.get("total"), job.get("done", 0)
+    st.markdown(f"**Query:** {job['query']} &nbsp;·&nbsp; **Status:** `{status}`")
+
+    if status == "queued":
+        st.info("⏳ Waiting for a worker. Start one with `python scrape_worker.py` if this job stays queued.")
+    elif status == "running":
+        if total:
+            st.progress(done / total, text=f"Scraped {done}/{total} websites...")
+        else:
+            st.progress(0, text="Searching Google for relevant websites...")
+    elif status == "failed":
+        st.error(f"❌ Job failed: {job.get('error')}")
+
+    for title in job.get("missing_urls", []):
+        st.warning(f"Skipping a result due to missing URL: {title}")
+    if job.get("known_skipped"):
+        with st.expander(f"⏭️ Skipped {len(job['known_skipped'])} already-known website(s) scraped in the last {job.get('refresh_after_days')} days"):
+            st.write("\n".join(f"- {url}" for url in job["known_skipped"]))
+
+    if status == "completed":
+        stats = job.get("cache_stats", {})
+        st.caption(f"SerpAPI pages: {stats.get('serp_hits', 0)} served from cache, {stats.get('serp_misses', 0)} fetched.")
+        cache_col1, cache_col2, cache_col3 = st.columns(3)
+        cache_col1.metric("🗄️ Cache Hits", stats.get("http_hits", 0))
+        cache_col2.metric("🔁 Revalidated (304)", stats.get("http_revalidated", 0))
+        cache_col3.metric("🌐 Cache Misses", stats.get("http_misses", 0))
+        show_save_summary(job["summary"])
+
+    df = pd.DataFrame([display_row(item) for item in job.get("results", [])])
+    st.subheader("📊 Scraped Contact Data")
+    if not df.empty:
+        st.dataframe(df, use_container_width=True)
+        if status == "completed":
+            st.download_button(
+                label="⬇️ Download Scraped Data (CSV)",
+                data=df.to_csv(index=False).encode("utf-8"),
+                file_name=f"scraped_contacts_{job['query'].replace(' ','_')}_{job['created_at'].strftime('%Y%m%d_%H%M%S')}.csv",
+                mime="text/csv",
+                help="Download the data displayed in the table above as a CSV file."
+            )
+    elif status == "completed":
+        st.info("No contact information was successfully extracted in this job.")
+
+def render_scrape_jobs():
+    """Shows the selected job and keeps rerunning the page while it is still in progress."""
+    db = get_db()
+    if db is None:
+        return
+    recent_jobs = fetch_recent_scrape_jobs(db)
+    if not recent_jobs:
+        return
+    job_ids = [str(job["_id"]) for job in recent_jobs]
+    labels = {
+        str(job["_id"]): f"{job['query']} — {job['status']} ({job['created_at'].strftime('%Y-%m-%d %H:%M')})"
+        for job in recent_jobs
+    }
+    current = st.session_state.get("scrape_job_id")
+    st.subheader("🗂️ Scrape Jobs")
+    selected = st.selectbox("Select a job to view:", job_ids,
+                            index=job_ids.index(current) if current in job_ids else 0,
+                            format_func=labels.get)
+    st.session_state.scrape_job_id = selected
+    job = fetch_scrape_job(db, selected)
+
+    show_scrape_job(job)
+    if job["status"] in ("queued", "running"):
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
 
 # ===============================
 # STREAMLIT UI
@@ -232,7 +732,11 @@ def main():
     # Input Section
     st.subheader("⚙️ Search Configuration")
     query = st.text_input("What kind of businesses are you looking for?", placeholder="e.g., 'Tech startups in Silicon Valley', 'Cafes in London', 'Dentists in New York'")
-    num_results = st.slider("Number of search results to process:", min_value=1, max_value=20, value=5)
+    num_results = st.slider("Number of search results to process:", min_value=1, max_value=MAX_SEARCH_RESULTS, value=5)
+    refresh_after_days = st.number_input(
+        "Re-scrape already-known websites after (days):", min_value=0, value=SCRAPE_REFRESH_DAYS,
+        help="Websites already in your contacts are skipped unless they were last scraped longer ago than this. Use 0 to always re-scrape."
+    )
 
     search_button = st.button("🚀 Start Scraping", use_container_width=True)
 
@@ -247,57 +751,18 @@ def main():
             st.warning("⚠️ Please enter a search query to begin!")
             return
 
-        client, db = get_db_connection()
-        if not client:
+        db = get_db()
+        if db is None:
             st.error("Cannot connect to MongoDB. Please check your `MONGO_URI` and network connection.")
             return
 
         try:
-            with st.spinner("Searching Google for relevant websites..."):
-                results = google_search(query, num_results=num_results)
-
-            if not results:
-                st.info("No organic search results found for your query. Try a different query.")
-                return
-
-            st.subheader("🌐 Scraping Websites for Contacts...")
-            progress_text = "Scraping in progress. Please wait."
-            progress_bar = st.progress(0, text=progress_text)
-
-            scraped_data_list = []
-            for i, item in enumerate(results):
-                website = item.get("url")
-                if website:
-                    progress_bar.progress((i + 1) / len(results), text=f"Scraping: {item.get('title', 'Unknown')} ({website})")
-                    contact_page = find_contact_page(website)
-                    item["contact_info"] = scrape_contact_page(contact_page)
-                    scraped_data_list.append(item)
-                else:
-                    st.warning(f"Skipping a result due to missing URL: {item.get('title', 'N/A')}")
-
-            progress_bar.empty() # Clear the progress bar after completion
-            st.success("✅ Website scraping complete! Processing and saving data...")
-
-            df = process_and_save_results(scraped_data_list, query, db)
-
-            st.subheader("📊 Scraped Contact Data")
-            if not df.empty:
-                st.dataframe(df, use_container_width=True)
-                st.download_button(
-                    label="⬇️ Download Scraped Data (CSV)",
-                    data=df.to_csv(index=False).encode("utf-8"),
-                    file_name=f"scraped_contacts_{query.replace(' ','_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                    mime="text/csv",
-                    help="Download the data displayed in the table above as a CSV file."
-                )
-            else:
-                st.info("No contact information was successfully extracted in this session.")
-
+            st.session_state.scrape_job_id = submit_scrape_job(db, query, num_results, int(refresh_after_days))
+            st.success("✅ Scrape job queued! It runs in the background, so you can leave or refresh this page.")
         except Exception as e:
             st.error(f"An unexpected error occurred: {e}")
-        finally:
-            if client: client.close()
-            st.info("Database connection closed.")
+
+    render_scrape_jobs()
     st.markdown("---")
 
 if __name__ == '__main__':
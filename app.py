@@ -7,6 +7,9 @@ from reply import main as reply_main
 from dashboard import main as dashboard_main
 from clean_data import main as clean_data_main
 from download_all_data import main as download_data_main # <-- IMPORT THE NEW MODULE
+from database import get_client, MONGO_DB_NAME
+from migrations import ensure_migrated
+from pymongo.errors import PyMongoError
 import os
 
 # ===============================
@@ -19,6 +22,15 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# ===============================
+# ONE-TIME DATABASE MIGRATION
+# ===============================
+# Creates indexes and applies schema changes once per process, not on every render
+try:
+    ensure_migrated(get_client()[MONGO_DB_NAME])
+except PyMongoError as e:
+    st.error(f"❌ **Database Migration Error:** {e}")
+
 # ===============================
 # CUSTOM STYLING
 # ===============================
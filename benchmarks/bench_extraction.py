@@ -0,0 +1,81 @@
+"""
+Micro-benchmark for contact extraction in ai_webscraper.
+
+Compares pages/sec of the original extraction (full BeautifulSoup tree with html.parser,
+regex scan over the whole body) against the bounded stage (body cut at MAX_PAGE_BYTES,
+anchor-only parse with HTML_PARSER, precompiled patterns).
+
+    python benchmarks/bench_extraction.py --pages 100 --size-kb 2048
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+import ai_webscraper as scraper
+
+
+def make_page(size_kb, rng):
+    """Builds a synthetic company page of roughly `size_kb` with nav links, contacts and filler."""
+    parts = ["<html><head><title>Acme</title></head><body><nav>"]
+    for name in ("Home", "Products", "About", "Team", "Careers", "Contact Us"):
+        parts.append(f'<a href="/{name.lower().replace(" ", "-")}">{name}</a>')
+    parts.append("</nav>")
+    filler = "<div class='card'><p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p><span>42</span></div>"
+    length = sum(len(p) for p in parts)
+    while length < size_kb * 1024:
+        parts.append(filler)
+        length += len(filler)
+        if rng.random() < 0.01:
+            contact = f"<p>Reach sales@acme{rng.randint(1, 9)}.com or call (555) 123-{rng.randint(1000, 9999)}</p>"
+            parts.append(contact)
+            length += len(contact)
+    parts.append("<footer><a href='mailto:info@acme.com'>info@acme.com</a></footer></body></html>")
+    return "".join(parts)
+
+
+def legacy_extract(html):
+    soup = BeautifulSoup(html, "html.parser")
+    for a in soup.find_all("a", href=True):
+        if "contact" in a["href"].lower() or "contact" in a.get_text(strip=True).lower():
+            break
+    return list(set(re.findall(scraper.EMAIL_REGEX, html))), list(set(re.findall(scraper.PHONE_REGEX, html)))
+
+
+def bounded_extract(html):
+    html = html.encode("utf-8")[:scraper.MAX_PAGE_BYTES].decode("utf-8", errors="replace")
+    scraper.rank_links(html)
+    return scraper.extract_contacts(html)
+
+
+def pages_per_second(extract, pages):
+    start = time.perf_counter()
+    for html in pages:
+        extract(html)
+    return len(pages) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--size-kb", type=int, default=2048, help="Approximate size of each synthetic page")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pages = [make_page(args.size_kb, rng) for _ in range(args.pages)]
+
+    before = pages_per_second(legacy_extract, pages)
+    after = pages_per_second(bounded_extract, pages)
+    print(f"pages: {args.pages} x ~{args.size_kb} KB  parser: {scraper.HTML_PARSER}  cap: {scraper.MAX_PAGE_BYTES // 1024} KB")
+    print(f"before: {before:8.2f} pages/sec")
+    print(f"after:  {after:8.2f} pages/sec  ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Offline throughput benchmark for the AI Web Scraper crawl path.
+
+Starts local HTTP servers that act as synthetic company websites (one port per site, so
+each is its own host for the per-host caps, robots.txt and politeness delay), stubs
+google_search to return them, and runs crawl_sites from ai_webscraper. Sites vary in
+page size, latency and link structure, and include slow responses, redirects, error
+pages and non-HTML "contact" links.
+
+    python benchmarks/bench_scraper.py --sites 40
+    python benchmarks/bench_scraper.py --sites 40 --runs 2   # second run measures the warm cache
+
+Reports pages/sec, p50/p95 crawl latency per site and peak memory.
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FILLER = "<div class='card'><p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p></div>"
+
+
+# ===============================
+# FIXTURE WEBSITES
+# ===============================
+def make_site(index, rng):
+    """Describes one synthetic site: its pages, latency and failure mode."""
+    kind = rng.choice(["plain", "plain", "deep", "large", "slow", "redirect", "error", "pdf_contact", "no_contact"])
+    domain = f"company{index}.test"
+    size_kb = 400 if kind == "large" else rng.choice([5, 20, 60])
+    pages = {
+        "/": ("html", ["About", "Products", "Blog"] + ([] if kind in ("deep", "no_contact") else ["Contact"]), []),
+        "/about": ("html", ["Team", "Careers"], [f"hello@{domain}"]),
+        "/team": ("html", [], [f"ceo@{domain}", f"cto@{domain}"]),
+        "/contact": ("pdf", [], []) if kind == "pdf_contact" else ("html", [], [f"sales@{domain}", f"support@{domain}"]),
+        "/products": ("html", [], []),
+        "/blog": ("html", [], []),
+        "/careers": ("html", [], [f"jobs@{domain}"]),
+    }
+    return {
+        "kind": kind, "size_kb": size_kb, "pages": pages,
+        "latency": rng.uniform(0.5, 3.0) if kind == "slow" else rng.uniform(0.005, 0.08),
+    }
+
+
+def render_page(site, path):
+    _, links, emails = site["pages"][path]
+    parts = ["<html><body><nav>"]
+    parts += [f'<a href="/{name.lower()}">{name}</a>' for name in links]
+    parts.append("</nav>")
+    length = sum(len(part) for part in parts)
+    while length < site["size_kb"] * 1024:
+        parts.append(FILLER)
+        length += len(FILLER)
+    parts += [f"<p>Email us at {email} or call (555) 010-{1000 + i}</p>" for i, email in enumerate(emails)]
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def make_handler(site):
+    class SiteHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def send_body(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            time.sleep(site["latency"])
+            path = self.path.split("?")[0].rstrip("/") or "/"
+            if path == "/robots.txt":
+                return self.send_body(200, "text/plain", b"User-agent: *\nDisallow: /private\n")
+            if site["kind"] == "redirect" and path == "/":
+                self.send_response(301)
+                self.send_header("Location", "/home")
+                self.end_headers()
+                return
+            if path == "/home":
+                path = "/"
+            if site["kind"] == "error" and path == "/":
+                return self.send_body(500, "text/html", b"<h1>Internal Server Error</h1>")
+            if path not in site["pages"]:
+                return self.send_body(404, "text/html", b"<h1>Not Found</h1>")
+            if site["pages"][path][0] == "pdf":
+                return self.send_body(200, "application/pdf", b"%PDF-1.4" + b"\0" * 200_000)
+            return self.send_body(200, "text/html; charset=utf-8", site["bodies"][path])
+
+    return SiteHandler
+
+
+def start_fixture_sites(count, seed):
+    rng = random.Random(seed)
+    servers, results = [], []
+    for i in range(count):
+        site = make_site(i, rng)
+        # Rendered once here so request handling measures the crawler, not fixture building
+        site["bodies"] = {path: render_page(site, path) for path, (kind, _, _) in site["pages"].items() if kind == "html"}
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(site))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        results.append({
+            "title": f"Company {i} ({site['kind']})",
+            "url": f"http://127.0.0.1:{server.server_address[1]}/",
+            "snippet": "Synthetic fixture site",
+        })
+    return servers, results
+
+
+# ===============================
+# BENCHMARK
+# ===============================
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_once(scraper, query):
+    fetch_count = 0
+    fetch_lock = threading.Lock()
+    site_latencies = []
+    original_fetch_page, original_crawl_domain = scraper.fetch_page, scraper.crawl_domain
+
+    def counting_fetch_page(url):
+        nonlocal fetch_count
+        with fetch_lock:
+            fetch_count += 1
+        return original_fetch_page(url)
+
+    def timed_crawl_domain(website_url, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original_crawl_domain(website_url, *args, **kwargs)
+        finally:
+            with fetch_lock:
+                site_latencies.append(time.perf_counter() - start)
+
+    scraper.fetch_page, scraper.crawl_domain = counting_fetch_page, timed_crawl_domain
+    scraper.HTTP_CACHE.reset_stats()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        results = scraper.google_search(query)
+        scraped = scraper.crawl_sites(results)
+    finally:
+        elapsed = time.perf_counter() - start
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        scraper.fetch_page, scraper.crawl_domain = original_fetch_page, original_crawl_domain
+
+    emails = sum(len(item["contact_info"]["emails"]) for item in scraped)
+    return {
+        "sites": len(scraped), "pages": fetch_count, "elapsed": elapsed, "emails": emails,
+        "p50": percentile(site_latencies, 50), "p95": percentile(site_latencies, 95),
+        "peak_mb": peak_bytes / (1024 * 1024), "cache": dict(scraper.HTTP_CACHE.stats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=1, help="Repeat the crawl; runs after the first hit the cache")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--host-delay", type=float, default=0.0, help="Overrides CRAWL_HOST_DELAY_SECONDS")
+    args = parser.parse_args()
+
+    # The scraper reads its limits at import time, so configure it before importing
+    cache_dir = tempfile.mkdtemp(prefix="scraper-bench-")
+    os.environ["SCRAPER_CACHE_DIR"] = cache_dir
+    os.environ["CRAWL_HOST_DELAY_SECONDS"] = str(args.host_delay)
+    import ai_webscraper as scraper
+
+    servers, fixture_results = start_fixture_sites(args.sites, args.seed)
+    scraper.google_search = lambda query, num_results=len(fixture_results): [dict(r) for r in fixture_results[:num_results]]
+
+    print(f"{args.sites} fixture sites, concurrency {scraper.MAX_CONCURRENT_SITES}, per host {scraper.MAX_CONCURRENT_PER_HOST}, cache {cache_dir}")
+    for run in range(1, args.runs + 1):
+        stats = run_once(scraper, "benchmark query")
+        print(
+            f"run {run}: {stats['sites']} sites, {stats['pages']} pages in {stats['elapsed']:.2f}s  "
+            f"{stats['pages'] / stats['elapsed']:.1f} pages/sec  "
+            f"site latency p50 {stats['p50']:.2f}s p95 {stats['p95']:.2f}s  "
+            f"peak traced memory {stats['peak_mb']:.1f} MB  emails {stats['emails']}  cache {stats['cache']}"
+        )
+    print(f"max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
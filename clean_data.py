@@ -1,9 +1,9 @@
 import streamlit as st
 import pandas as pd
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
-import os
+from io import StringIO
 from dotenv import load_dotenv
+from database import get_db
+from contact_fields import LIST_FIELDS, join_values
 from datetime import datetime
 import pytz
 
@@ -13,55 +13,71 @@ load_dotenv()
 # ===============================
 # CONFIGURATION
 # ===============================
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
-CLEANED_CSV_PATH = "cleaned_contacts.csv"
 CLEANED_COLLECTION_NAME = "cleaned_contacts"
+DISPLAY_COLUMNS = [
+    "name", "work_emails", "personal_emails", "phones",
+    "source", "source_url", "domain", "created_at"
+]
+PAGE_SIZE_OPTIONS = [25, 50, 100, 250]
+CSV_BATCH_SIZE = 1000
 
 # ===============================
 # DATABASE & DATA FUNCTIONS
 # ===============================
-def get_db_connection():
-    """Establishes and returns a connection to the MongoDB database."""
+def count_cleaned_contacts(db):
+    """Cheap total from collection metadata instead of a full scan."""
     try:
-        client = MongoClient(MONGO_URI)
-        client.admin.command('ismaster')
-        db = client[MONGO_DB_NAME]
-        return client, db
-    except ConnectionFailure as e:
-        st.error("❌ **Database Connection Error:** Could not connect to MongoDB.")
-        st.error(e)
-        return None, None
-
-
-def fetch_cleaned_contacts(db):
-    """Fetches records and ensures clean display with ordered columns."""
+        return db[CLEANED_COLLECTION_NAME].estimated_document_count()
+    except Exception as error:
+        st.warning(f"⚠️ Could not count cleaned contacts. Error: {error}")
+        return 0
+
+
+def format_list_columns(df):
+    """Shows email/phone arrays (or legacy comma-joined strings) as one readable string."""
+    for col in LIST_FIELDS:
+        if col in df.columns:
+            df[col] = df[col].map(join_values)
+    return df
+
+
+def fetch_cleaned_contacts_page(db, page_size, before_id=None):
+    """
+    Fetches one page of contacts, newest first, with only the displayed fields. Pages are
+    ranges on `_id` (everything older than `before_id`), so no documents are skipped over.
+    Returns (DataFrame, last _id on the page, whether an older page exists).
+    """
     try:
-        cursor = db[CLEANED_COLLECTION_NAME].find().sort('_id', -1)
-        df = pd.DataFrame(list(cursor))
-        if df.empty:
-            return pd.DataFrame()
-
-        if '_id' in df.columns:
-            df = df.drop(columns=['_id'])
-
-        desired_order = [
-            "name", "work_emails", "personal_emails", "phones",
-            "source", "source_url", "domain", "created_at"
-        ]
-        final_columns = [col for col in desired_order if col in df.columns]
-        return df[final_columns]
+        query = {"_id": {"$lt": before_id}} if before_id is not None else {}
+        projection = {col: 1 for col in DISPLAY_COLUMNS}
+        docs = list(db[CLEANED_COLLECTION_NAME].find(query, projection).sort('_id', -1).limit(page_size + 1))
+        has_next = len(docs) > page_size
+        docs = docs[:page_size]
+        if not docs:
+            return pd.DataFrame(), None, False
+
+        df = format_list_columns(pd.DataFrame(docs))
+        final_columns = [col for col in DISPLAY_COLUMNS if col in df.columns]
+        return df[final_columns], docs[-1]["_id"], has_next
     except Exception as error:
         st.warning(f"⚠️ Could not fetch cleaned contacts. Error: {error}")
-        return pd.DataFrame()
+        return pd.DataFrame(), None, False
 
 
-def save_df_to_csv(df):
-    """Saves the DataFrame to a CSV file for download."""
-    if not df.empty:
-        df.to_csv(CLEANED_CSV_PATH, index=False)
-        return True
-    return False
+def build_contacts_csv(db):
+    """Builds the full CSV in memory, batch by batch; only runs when a download is requested."""
+    buffer = StringIO()
+    projection = {"_id": 0, **{col: 1 for col in DISPLAY_COLUMNS}}
+    cursor = db[CLEANED_COLLECTION_NAME].find({}, projection).sort('_id', -1).batch_size(CSV_BATCH_SIZE)
+    batch, header = [], True
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= CSV_BATCH_SIZE:
+            format_list_columns(pd.DataFrame(batch, columns=DISPLAY_COLUMNS)).to_csv(buffer, index=False, header=header)
+            batch, header = [], False
+    if batch or header:
+        format_list_columns(pd.DataFrame(batch, columns=DISPLAY_COLUMNS)).to_csv(buffer, index=False, header=header)
+    return buffer.getvalue().encode("utf-8")
 
 
 # ===============================
@@ -135,16 +151,21 @@ def main():
         if st.button("🔄 Refresh Data"):
             st.rerun()
 
-    client, db = get_db_connection()
-    if not client:
+    db = get_db()
+    if db is None:
         return
 
-    cleaned_df = fetch_cleaned_contacts(db)
-    client.close()
+    total_contacts = count_cleaned_contacts(db)
 
     # --- DATA DISPLAY ---
-    if not cleaned_df.empty:
-        csv_saved = save_df_to_csv(cleaned_df)
+    if total_contacts:
+        # Stack of page boundaries: each entry is the `_id` the page starts below
+        if "contacts_page_bounds" not in st.session_state:
+            st.session_state.contacts_page_bounds = [None]
+        page_size = st.selectbox("Rows per page:", PAGE_SIZE_OPTIONS, index=1,
+                                 on_change=lambda: st.session_state.update(contacts_page_bounds=[None]))
+        page_number = len(st.session_state.contacts_page_bounds)
+        cleaned_df, last_id, has_next = fetch_cleaned_contacts_page(db, page_size, st.session_state.contacts_page_bounds[-1])
 
         # ✅ FIX TIMEZONE (India Time)
         india_tz = pytz.timezone("Asia/Kolkata")
@@ -157,7 +178,7 @@ def main():
             st.markdown(f"""
                 <div class='metric-card'>
                     <h3>👥 Total Contacts</h3>
-                    <h2>{len(cleaned_df)}</h2>
+                    <h2>{total_contacts}</h2>
                 </div>
             """, unsafe_allow_html=True)
         with col2:
@@ -171,19 +192,34 @@ def main():
             st.markdown(f"""
                 <div class='metric-card'>
                     <h3>🗂️ Columns</h3>
-                    <h2>{len(cleaned_df.columns)}</h2>
+                    <h2>{len(DISPLAY_COLUMNS)}</h2>
                 </div>
             """, unsafe_allow_html=True)
 
         st.markdown("### 📋 Contacts Data")
         st.dataframe(cleaned_df, use_container_width=True)
 
+        # --- PAGINATION ---
+        first_row = (page_number - 1) * page_size + 1
+        nav_prev, nav_info, nav_next = st.columns([1, 4, 1])
+        with nav_prev:
+            if st.button("⬅️ Previous", disabled=page_number == 1, use_container_width=True):
+                st.session_state.contacts_page_bounds.pop()
+                st.rerun()
+        with nav_info:
+            st.markdown(f"<p style='text-align:center;'>Page {page_number} · rows {first_row}–{first_row + len(cleaned_df) - 1} of ~{total_contacts}</p>",
+                        unsafe_allow_html=True)
+        with nav_next:
+            if st.button("Next ➡️", disabled=not has_next, use_container_width=True):
+                st.session_state.contacts_page_bounds.append(last_id)
+                st.rerun()
+
         # --- DOWNLOAD BUTTON ---
-        if csv_saved:
-            with open(CLEANED_CSV_PATH, "rb") as file:
+        if st.button("📦 Prepare CSV Download", use_container_width=True):
+            with st.spinner("Building CSV from all contacts..."):
                 st.download_button(
                     label="📥 Download Cleaned Data (CSV)",
-                    data=file,
+                    data=build_contacts_csv(db),
                     file_name="cleaned_contacts.csv",
                     mime="text/csv",
                     key="download_button",
@@ -0,0 +1,187 @@
+from pymongo import UpdateOne
+from contact_fields import PERSONAL_EMAIL_DOMAINS, contact_emails
+
+# ===============================
+# CONFIGURATION
+# ===============================
+CLEANED_COLLECTION_NAME = "cleaned_contacts"
+RESOLVE_BATCH_SIZE = 500
+
+COMPANY_SOURCE = "Web Scraper"  # One record per company website; every other source is a person
+
+# Hosts shared by unrelated companies; a match on one of these says nothing about identity
+SHARED_DOMAINS = set(PERSONAL_EMAIL_DOMAINS) | {
+    "linkedin.com", "facebook.com", "twitter.com", "x.com", "instagram.com",
+    "youtube.com", "github.com", "medium.com", "wordpress.com", "blogspot.com",
+    "yelp.com", "yellowpages.com", "justdial.com", "indiamart.com", "clutch.co",
+    "crunchbase.com", "glassdoor.com", "tripadvisor.com", "google.com", "maps.google.com"
+}
+
+# Scraped "emails" that are really asset names or error-tracker DSNs, never a person or company
+ASSET_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico", ".css", ".js")
+JUNK_EMAIL_DOMAINS = {"sentry.io", "sentry.wixpress.com", "sentry-next.wixpress.com", "example.com", "domain.com"}
+
+# ===============================
+# BLOCKING KEYS
+# ===============================
+# Blocking keys only decide which records get compared: resolution costs one indexed lookup
+# per batch instead of comparing every pair. Records are merged on an actual match only:
+#   - the same normalized email (for a scraped site, only emails at the site's own domain:
+#     agency, host and platform addresses in shared footers say nothing about identity), or
+#   - a scraped company site whose domain equals a ContactOut person's company domain
+#     (the company joins one person; people are never merged with each other on domain).
+
+def normalize_domain(value):
+    """Bare lowercase host: "https://www.Acme.com:443/about" -> "acme.com"."""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    host = value.strip().lower().split("://")[-1].split("/")[0].split(":")[0]
+    host = host.removeprefix("www.")
+    return host if "." in host else None
+
+def is_real_email(email):
+    local, _, domain = email.rpartition("@")
+    return bool(local) and "." in domain and not domain.endswith(ASSET_SUFFIXES) and domain not in JUNK_EMAIL_DOMAINS
+
+def is_shared_domain(domain):
+    """True for hosts many unrelated contacts live on (yelp.com, m.facebook.com, gmail.com...)."""
+    return any(domain == shared or domain.endswith("." + shared) for shared in SHARED_DOMAINS)
+
+def own_domain(contact):
+    """The record's own domain: the scraped site for companies, the company domain for people."""
+    if contact.get("source") == COMPANY_SOURCE:
+        domain = normalize_domain(contact.get("source_url")) or normalize_domain(contact.get("domain"))
+    else:
+        domain = normalize_domain(contact.get("domain"))
+    return None if domain and is_shared_domain(domain) else domain
+
+def is_own_email(email, domain):
+    """True when the email belongs to the domain or one of its subdomains."""
+    email_domain = email.rpartition("@")[2]
+    return bool(domain) and (email_domain == domain or email_domain.endswith("." + domain))
+
+def block_keys(contact):
+    """Blocking keys for a contact: its own domain and each real email it holds (a site's own emails only)."""
+    domain = own_domain(contact)
+    emails = [email for email in contact_emails(contact) if is_real_email(email)]
+    if contact.get("source") == COMPANY_SOURCE:
+        emails = [email for email in emails if is_own_email(email, domain)]
+    keys = {f"email:{email}" for email in emails}
+    if domain:
+        keys.add(f"domain:{domain}")
+    return sorted(keys)
+
+# ===============================
+# RESOLUTION
+# ===============================
+class UnionFind:
+    """Disjoint sets whose root is always the smallest member, so the oldest record becomes canonical."""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        self.parent.setdefault(item, item)
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+def merge_matches(uf, holders, is_company):
+    """Unions records that actually match, given every holder of each blocking key."""
+    # The same email is the same entity; two scraped records of the same site are the same company
+    for key, record_ids in holders.items():
+        if key.startswith("email:"):
+            matches = record_ids
+        else:
+            matches = [record_id for record_id in record_ids if is_company[record_id]]
+        for record_id in matches[1:]:
+            uf.union(matches[0], record_id)
+
+    # A company with no person yet joins the oldest person at its domain; people stay apart
+    person_roots = {uf.find(record_id) for record_id, company in is_company.items() if not company}
+    for key in sorted(holders):
+        if not key.startswith("domain:"):
+            continue
+        companies = [record_id for record_id in holders[key] if is_company[record_id]]
+        people = [record_id for record_id in holders[key] if not is_company[record_id]]
+        if not companies or not people:
+            continue
+        company_root = uf.find(companies[0])
+        if company_root in person_roots:
+            continue
+        uf.union(company_root, min(people))
+        person_roots.add(uf.find(company_root))
+
+def resolve_batch(collection, pending):
+    """Merges one batch of unresolved contacts into the existing clusters they actually match."""
+    uf = UnionFind()
+    pending_keys = {}
+    current = {}
+    is_company = {}
+    holders = {}
+    for doc in pending:
+        pending_keys[doc["_id"]] = block_keys(doc)
+        current[doc["_id"]] = doc.get("canonical_id")
+        is_company[doc["_id"]] = doc.get("source") == COMPANY_SOURCE
+        for key in pending_keys[doc["_id"]]:
+            holders.setdefault(key, []).append(doc["_id"])
+
+    # Resolved records in the same blocks, then every member of the clusters they belong to
+    neighbours = collection.find(
+        {"block_keys": {"$in": list(holders)}, "_id": {"$nin": list(pending_keys)}},
+        {"source": 1, "canonical_id": 1, "block_keys": 1}
+    ) if holders else []
+    for doc in neighbours:
+        current[doc["_id"]] = doc.get("canonical_id")
+        is_company[doc["_id"]] = doc.get("source") == COMPANY_SOURCE
+        for key in doc.get("block_keys", []):
+            if key in holders:
+                holders[key].append(doc["_id"])
+    cluster_ids = {canonical_id for canonical_id in current.values() if canonical_id is not None}
+    if cluster_ids:
+        for doc in collection.find({"canonical_id": {"$in": list(cluster_ids)}}, {"source": 1, "canonical_id": 1}):
+            current.setdefault(doc["_id"], doc["canonical_id"])
+            is_company.setdefault(doc["_id"], doc.get("source") == COMPANY_SOURCE)
+    for record_id, canonical_id in current.items():
+        uf.find(record_id)
+        if canonical_id is not None:
+            uf.union(record_id, canonical_id)
+
+    for record_ids in holders.values():
+        record_ids.sort()
+    merge_matches(uf, holders, is_company)
+
+    operations = []
+    for record_id, canonical_id in current.items():
+        root = uf.find(record_id)
+        if record_id in pending_keys:
+            operations.append(UpdateOne({"_id": record_id}, {"$set": {"block_keys": pending_keys[record_id], "canonical_id": root}}))
+        elif canonical_id != root:
+            operations.append(UpdateOne({"_id": record_id}, {"$set": {"canonical_id": root}}))
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+    return sum(1 for record_id in current if uf.find(record_id) != record_id)
+
+def resolve_pending_contacts(db, batch_size=RESOLVE_BATCH_SIZE):
+    """
+    Resolves every contact without blocking keys (new inserts, refreshed records) and writes
+    a `canonical_id` to each record: the _id of the oldest record of the same entity. Safe
+    to re-run. Returns {"resolved": records processed, "duplicates": non-canonical records touched}.
+    """
+    collection = db[CLEANED_COLLECTION_NAME]
+    projection = {"domain": 1, "source": 1, "source_url": 1, "work_emails": 1, "personal_emails": 1, "canonical_id": 1}
+    totals = {"resolved": 0, "duplicates": 0}
+    while True:
+        pending = list(collection.find({"block_keys": None}, projection).sort("_id", 1).limit(batch_size))
+        if not pending:
+            return totals
+        totals["duplicates"] += resolve_batch(collection, pending)
+        totals["resolved"] += len(pending)
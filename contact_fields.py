@@ -0,0 +1,67 @@
+import re
+from urllib.parse import urlparse
+
+# ===============================
+# CONFIGURATION
+# ===============================
+EMAIL_FIELDS = ("work_emails", "personal_emails")
+LIST_FIELDS = EMAIL_FIELDS + ("phones",)
+ALL_EMAILS_FIELD = "emails"  # Lowercased union of work and personal emails, multikey indexed
+LINKEDIN_KEY_FIELD = "linkedin_key"  # normalize_linkedin_url(source_url) on ContactOut contacts
+PERSONAL_EMAIL_DOMAINS = [
+    "gmail.com", "yahoo.com", "hotmail.com", "outlook.com", "aol.com",
+    "icloud.com", "protonmail.com", "zoho.com", "gmx.com"
+]
+
+# ===============================
+# NORMALIZATION
+# ===============================
+# Contacts used to store these fields as comma-joined strings; readers accept both forms
+# until the backfill migration has rewritten every document as arrays.
+
+def as_list(value):
+    """Returns a list of non-empty, stripped values from an array or a comma-joined string."""
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple)):
+        return []
+    return [str(item).strip() for item in value if item is not None and str(item).strip()]
+
+def normalize_emails(values):
+    """Lowercases and de-duplicates emails, keeping their original order."""
+    return list(dict.fromkeys(email.lower() for email in as_list(values)))
+
+def contact_list_fields(work_emails, personal_emails, phones):
+    """The array fields stored on a cleaned contact, including the combined `emails` lookup field."""
+    work = normalize_emails(work_emails)
+    personal = normalize_emails(personal_emails)
+    return {
+        "work_emails": work,
+        "personal_emails": personal,
+        "phones": list(dict.fromkeys(as_list(phones))),
+        ALL_EMAILS_FIELD: list(dict.fromkeys(work + personal)),
+    }
+
+def contact_emails(contact):
+    """Every email on a contact, work emails first, whichever form the document is stored in."""
+    return normalize_emails(as_list(contact.get("work_emails")) + as_list(contact.get("personal_emails")))
+
+def primary_email(contact):
+    emails = contact_emails(contact)
+    return emails[0] if emails else None
+
+def normalize_linkedin_url(url):
+    """"https://www.LinkedIn.com/in/jane/" and "linkedin.com/in/jane" both become "linkedin.com/in/jane"."""
+    parts = urlparse(url.strip().lower() if "://" in url else "https://" + url.strip().lower())
+    return parts.netloc.removeprefix("www.") + parts.path.rstrip("/")
+
+def join_values(value):
+    """Display form of a list field: "a@x.com, b@y.com"."""
+    return ", ".join(as_list(value))
+
+# ===============================
+# QUERIES
+# ===============================
+def exact_email_regex(email):
+    """Case-insensitive exact match for unsubscribe documents that predate lowercasing."""
+    return {"$regex": f"^{re.escape(email.strip())}$", "$options": "i"}
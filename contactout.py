@@ -1,10 +1,18 @@
 import streamlit as st
 import requests
 import os
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, OperationFailure
+import random
+import threading
+import time
+import pandas as pd
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import PyMongoError
 from dotenv import load_dotenv
 import datetime
+from database import get_db, flush_bulk, new_write_summary
+from contact_dedupe import resolve_pending_contacts
+from contact_fields import LINKEDIN_KEY_FIELD, contact_list_fields, join_values, normalize_linkedin_url
 
 # ===============================
 # CONFIGURATION
@@ -12,12 +20,25 @@ import datetime
 load_dotenv()
 
 CONTACTOUT_API_TOKEN = os.getenv("CONTACTOUT_API_TOKEN")
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 API_BASE = "https://api.contactout.com/v1/people/enrich"
 
 RAW_CONTACTOUT_COLLECTION = "contacts"
 CLEANED_COLLECTION_NAME = "cleaned_contacts"
+ENRICHMENT_CACHE_COLLECTION = "enrichment_cache"
+
+# Enrichment results newer than this are reused instead of paying for another lookup
+ENRICHMENT_CACHE_DAYS = int(os.getenv("ENRICHMENT_CACHE_DAYS", 30))
+
+# Bulk enrichment: requests are spread by a token bucket tuned to the plan's quota
+CONTACTOUT_RATE_PER_MINUTE = int(os.getenv("CONTACTOUT_RATE_PER_MINUTE", 60))
+CONTACTOUT_MAX_CONCURRENCY = int(os.getenv("CONTACTOUT_MAX_CONCURRENCY", 4))
+CONTACTOUT_MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+REQUEST_TIMEOUT = 30
+MONGO_BATCH_SIZE = 200
+INCLUDE_FIELDS = ["work_email", "personal_email", "phone"]
 
 # ===============================
 # PAGE CONFIG & STYLING
@@ -78,15 +99,17 @@ st.markdown("""
 # ===============================
 # UTILITIES
 # ===============================
-def enrich_people(payload):
-    headers = {
+def api_headers():
+    return {
         "Content-Type": "application/json",
         "Accept": "application/json",
         "token": CONTACTOUT_API_TOKEN
     }
+
+def enrich_people(payload):
     with st.spinner("🔄 Calling ContactOut API..."):
         try:
-            resp = requests.post(API_BASE, headers=headers, json=payload)
+            resp = requests.post(API_BASE, headers=api_headers(), json=payload, timeout=REQUEST_TIMEOUT)
             if resp.status_code != 200:
                 st.error(f"❌ API Error {resp.status_code}")
                 st.json(resp.json())
@@ -95,6 +118,53 @@ def enrich_people(payload):
             st.error(f"A network error occurred: {e}")
             return None, None
 
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` calls per second, with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+def enrich_with_backoff(session, payload, bucket):
+    """
+    Calls the enrich API through the rate limiter without touching the UI, so it can run
+    on worker threads. 429 and 5xx responses are retried with exponential backoff and
+    full jitter, honouring Retry-After. Returns (status_code, json) like enrich_people.
+    """
+    for attempt in range(CONTACTOUT_MAX_RETRIES + 1):
+        bucket.acquire()
+        retry_after = None
+        try:
+            resp = session.post(API_BASE, headers=api_headers(), json=payload, timeout=REQUEST_TIMEOUT)
+            if resp.status_code not in RETRYABLE_STATUS_CODES or attempt == CONTACTOUT_MAX_RETRIES:
+                try:
+                    return resp.status_code, resp.json()
+                except ValueError:
+                    return resp.status_code, {"error": resp.text[:200]}
+            retry_after = resp.headers.get("Retry-After")
+        except requests.exceptions.RequestException as e:
+            if attempt == CONTACTOUT_MAX_RETRIES:
+                return None, {"error": str(e)}
+        delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        time.sleep(delay)
+
 def extract_relevant_fields(response, original_payload={}):
     profile = response.get("profile", response)
     linkedin_url = profile.get("linkedin_url") or original_payload.get("linkedin_url", "")
@@ -102,34 +172,13 @@ def extract_relevant_fields(response, original_payload={}):
     return {
         "name": profile.get("full_name"),
         "source_url": linkedin_url.rstrip('/'),
-        "work_emails": ", ".join(profile.get("work_email", [])),
-        "personal_emails": ", ".join(profile.get("personal_email", [])),
-        "phones": ", ".join(profile.get("phone", [])),
+        LINKEDIN_KEY_FIELD: normalize_linkedin_url(linkedin_url) if linkedin_url else None,
+        **contact_list_fields(profile.get("work_email", []), profile.get("personal_email", []), profile.get("phone", [])),
         "domain": profile.get("company", {}).get("domain") if profile.get("company") else None,
         "source": "ContactOut",
         "created_at": datetime.datetime.now(datetime.timezone.utc)
     }
 
-def get_db_connection():
-    try:
-        client = MongoClient(MONGO_URI)
-        client.admin.command('ismaster')
-        db = client[MONGO_DB_NAME]
-        return client, db
-    except ConnectionFailure as e:
-        st.error(f"❌ **Database Connection Error:** {e}")
-        return None, None
-
-def setup_database_indexes():
-    client, db = get_db_connection()
-    if not client: return
-    try:
-        db[CLEANED_COLLECTION_NAME].create_index("source_url", unique=True)
-    except OperationFailure:
-        pass
-    finally:
-        if client: client.close()
-
 def save_to_raw_log(db, data):
     try:
         db[RAW_CONTACTOUT_COLLECTION].insert_one(data)
@@ -149,34 +198,258 @@ def save_to_cleaned_mongo(db, dict_data):
             upsert=True
         )
         if result.upserted_id:
+            resolve_pending_contacts(db)
             st.success(f"✨ New contact added: {dict_data.get('name')}")
         else:
             st.info(f"ℹ️ Contact already exists: {dict_data.get('name')}")
     except Exception as e:
         st.error(f"❌ Error during cleaned save operation: {e}")
 
-def process_enrichment(payload):
+# ===============================
+# LOOKUP CACHE
+# ===============================
+class SingleFlight:
+    """Merges concurrent calls for the same key into one in-flight call whose result every caller shares."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        if key is None:
+            return fn()
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._calls[key] = future
+        if not is_leader:
+            return future.result()
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+# Shared by every session in this Streamlit process
+_enrich_in_flight = SingleFlight()
+
+def lookup_key(payload):
+    """Normalized cache key for a payload: LinkedIn URL, email, name + company or domain."""
+    if payload.get("linkedin_url"):
+        return "linkedin:" + normalize_linkedin_url(payload["linkedin_url"])
+    if payload.get("email"):
+        return "email:" + payload["email"].strip().lower()
+    if payload.get("full_name") and payload.get("company"):
+        name = " ".join(payload["full_name"].lower().split())
+        company = " ".join(str(payload["company"][0]).lower().split())
+        return f"name:{name}|{company}"
+    if payload.get("company_domain"):
+        return "domain:" + payload["company_domain"].strip().lower().removeprefix("www.")
+    return None
+
+def cache_cutoff(max_age_days):
+    return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=max_age_days)
+
+def lookup_cached_enrichments(db, payloads, max_age_days=ENRICHMENT_CACHE_DAYS):
+    """
+    Returns {lookup_key: enriched_data} for every payload with a result newer than
+    `max_age_days`, in one query. LinkedIn lookups also fall back to ContactOut contacts
+    already in cleaned_contacts.
+    """
+    keys = {lookup_key(payload) for payload in payloads} - {None}
+    if not keys:
+        return {}
+    cutoff = cache_cutoff(max_age_days)
+    cached = {}
+    for doc in db[ENRICHMENT_CACHE_COLLECTION].find({"_id": {"$in": list(keys)}, "fetched_at": {"$gte": cutoff}}):
+        cached[doc["_id"]] = doc["data"]
+
+    # Matched on the normalized URL: the pasted and stored forms differ in case, scheme, www and slashes
+    missing_linkedin = {
+        normalize_linkedin_url(payload["linkedin_url"]): lookup_key(payload)
+        for payload in payloads if payload.get("linkedin_url") and lookup_key(payload) not in cached
+    }
+    if missing_linkedin:
+        query = {"source": "ContactOut", LINKEDIN_KEY_FIELD: {"$in": list(missing_linkedin)}, "created_at": {"$gte": cutoff}}
+        for doc in db[CLEANED_COLLECTION_NAME].find(query, {"_id": 0}):
+            cached[missing_linkedin[doc[LINKEDIN_KEY_FIELD]]] = doc
+    return cached
+
+def cache_operation(payload, enriched_data):
+    data = {key: value for key, value in enriched_data.items() if key != "_id"}
+    return UpdateOne(
+        {"_id": lookup_key(payload)},
+        {"$set": {"data": data, "fetched_at": datetime.datetime.now(datetime.timezone.utc)}},
+        upsert=True
+    )
+
+# ===============================
+# BULK ENRICHMENT
+# ===============================
+def payload_from_line(line):
+    """Builds an enrich payload from a pasted LinkedIn URL, email, "Name, Company" or domain."""
+    value = line.strip()
+    if not value:
+        return None
+    if "linkedin.com" in value.lower():
+        return {"linkedin_url": value, "include": INCLUDE_FIELDS}
+    if "@" in value:
+        return {"email": value, "include": INCLUDE_FIELDS}
+    if "," in value:
+        name, company = [part.strip() for part in value.split(",", 1)]
+        if name and company:
+            return {"full_name": name, "company": [company], "include": INCLUDE_FIELDS}
+        return None
+    if "." in value and " " not in value:
+        return {"company_domain": value, "include": INCLUDE_FIELDS}
+    return None
+
+def payloads_from_csv(df):
+    """Builds one payload per CSV row from linkedin_url, email, full_name + company or company_domain columns."""
+    df = df.rename(columns=lambda col: str(col).strip().lower().replace(" ", "_"))
+    df = df.rename(columns={"linkedin": "linkedin_url", "name": "full_name", "domain": "company_domain"})
+    payloads = []
+    for row in df.fillna("").astype(str).to_dict("records"):
+        row = {key: value.strip() for key, value in row.items()}
+        if row.get("linkedin_url"):
+            payloads.append({"linkedin_url": row["linkedin_url"], "include": INCLUDE_FIELDS})
+        elif row.get("email"):
+            payloads.append({"email": row["email"], "include": INCLUDE_FIELDS})
+        elif row.get("full_name") and row.get("company"):
+            payloads.append({"full_name": row["full_name"], "company": [row["company"]], "include": INCLUDE_FIELDS})
+        elif row.get("company_domain"):
+            payloads.append({"company_domain": row["company_domain"], "include": INCLUDE_FIELDS})
+    return payloads
+
+def describe_payload(payload):
+    if payload.get("company"):
+        return f"{payload['full_name']}, {payload['company'][0]}"
+    return payload.get("linkedin_url") or payload.get("email") or payload.get("company_domain") or ""
+
+def process_bulk_enrichment(payloads, max_age_days=ENRICHMENT_CACHE_DAYS, force_refresh=False):
+    """
+    Enriches all payloads concurrently through the token bucket, updating a progress
+    table as each finishes, and writes results to both collections in bulk batches.
+    Payloads with a fresh cached result are answered without calling the API, and inputs
+    repeated in one upload are sent once with the result shown on every matching row.
+    """
+    db = get_db()
+    if db is None: return
+
+    bucket = TokenBucket(CONTACTOUT_RATE_PER_MINUTE / 60, capacity=CONTACTOUT_MAX_CONCURRENCY)
+    rows = [{"Input": describe_payload(payload), "Status": "⏳ Queued", "Name": "", "Work Emails": "", "Personal Emails": "", "Phones": ""}
+            for payload in payloads]
+    raw_ops, cleaned_ops, cache_ops = [], [], []
+    summary = new_write_summary()
+    cache_summary = new_write_summary()
+    cached = {} if force_refresh else lookup_cached_enrichments(db, payloads, max_age_days)
+
+    progress_bar = st.progress(0, text=f"Enriching {len(payloads)} contacts...")
+    table = st.empty()
+    table.dataframe(pd.DataFrame(rows), use_container_width=True)
+
+    def enrich(session, payload):
+        return _enrich_in_flight.do(lookup_key(payload), lambda: enrich_with_backoff(session, payload, bucket))
+
+    def show_result(i, status_text, enriched_data):
+        rows[i].update({
+            "Status": status_text, "Name": enriched_data.get("name"), "Work Emails": join_values(enriched_data.get("work_emails")),
+            "Personal Emails": join_values(enriched_data.get("personal_emails")), "Phones": join_values(enriched_data.get("phones"))
+        })
+
+    to_fetch = {}  # lookup key (or row index for unkeyable inputs) -> rows sharing that input
+    for i, payload in enumerate(payloads):
+        if lookup_key(payload) in cached:
+            show_result(i, "♻️ Cached", cached[lookup_key(payload)])
+        else:
+            to_fetch.setdefault(lookup_key(payload) or i, []).append(i)
+    done = len(payloads) - sum(len(group) for group in to_fetch.values())
+    cached_count = done
+
+    try:
+        with requests.Session() as session, ThreadPoolExecutor(max_workers=CONTACTOUT_MAX_CONCURRENCY) as executor:
+            futures = {executor.submit(enrich, session, payloads[group[0]]): group for group in to_fetch.values()}
+            for future in as_completed(futures):
+                group = futures[future]
+                i = group[0]
+                done += len(group)
+                status, response = future.result()
+                if status == 200 and isinstance(response, dict):
+                    enriched_data = extract_relevant_fields(response, payloads[i])
+                    for row in group:
+                        show_result(row, "✅ Enriched", enriched_data)
+                    cache_ops.append(cache_operation(payloads[i], enriched_data))
+                    raw_ops.append(InsertOne(dict(enriched_data)))
+                    if enriched_data.get("source_url"):
+                        cleaned_ops.append(UpdateOne({'source_url': enriched_data["source_url"]}, {'$setOnInsert': dict(enriched_data)}, upsert=True))
+                else:
+                    status_text = "🟡 Not Found" if status == 404 else f"❌ Error {status or 'network'}"
+                    for row in group:
+                        rows[row]["Status"] = status_text
+
+                if len(raw_ops) >= MONGO_BATCH_SIZE:
+                    flush_bulk(db[RAW_CONTACTOUT_COLLECTION], raw_ops, summary)
+                if len(cleaned_ops) >= MONGO_BATCH_SIZE:
+                    flush_bulk(db[CLEANED_COLLECTION_NAME], cleaned_ops, summary)
+                if len(cache_ops) >= MONGO_BATCH_SIZE:
+                    flush_bulk(db[ENRICHMENT_CACHE_COLLECTION], cache_ops, cache_summary)
+                progress_bar.progress(done / len(payloads), text=f"Enriched {done}/{len(payloads)}: {rows[i]['Input']}")
+                table.dataframe(pd.DataFrame(rows), use_container_width=True)
+
+        flush_bulk(db[RAW_CONTACTOUT_COLLECTION], raw_ops, summary)
+        flush_bulk(db[CLEANED_COLLECTION_NAME], cleaned_ops, summary)
+        flush_bulk(db[ENRICHMENT_CACHE_COLLECTION], cache_ops, cache_summary)
+        try:
+            resolve_pending_contacts(db)
+        except PyMongoError as error:
+            summary["errors"] += 1
+            summary["error_messages"].append(f"de-duplication failed: {error}")
+        progress_bar.empty()
+        table.dataframe(pd.DataFrame(rows), use_container_width=True)
+        if cached:
+            st.info(f"♻️ {cached_count} contact(s) answered from the lookup cache; no API credits used for them.")
+        st.success(f"✅ Saved {summary['raw_logged']} enriched records. {summary['inserted']} new contacts added; "
+                   f"{summary['duplicates']} already existed.")
+        if summary["errors"]:
+            st.error(f"❌ {summary['errors']} write(s) failed: {'; '.join(summary['error_messages'][:3])}")
+    except Exception as error:
+        st.error(f"❌ Error during bulk enrichment: {error}")
+
+def process_enrichment(payload, max_age_days=ENRICHMENT_CACHE_DAYS, force_refresh=False):
     if not payload:
         st.warning("⚠️ No valid input provided.")
         return
-    status, response = enrich_people(payload)
-    if status != 200 or not isinstance(response, dict):
-        if status == 404: st.warning("🟡 Contact Not Found.")
-        return
+    db = get_db()
+    if db is None: return
+    try:
+        cached = {} if force_refresh else lookup_cached_enrichments(db, [payload], max_age_days)
+        if lookup_key(payload) in cached:
+            st.info("♻️ Found a recent result in the lookup cache; no API credits used. Tick 'Force refresh' to call ContactOut again.")
+            st.markdown("### ✅ Enriched Data:")
+            st.json(cached[lookup_key(payload)])
+            return
 
-    enriched_data = extract_relevant_fields(response, payload)
-    st.markdown("### ✅ Enriched Data:")
-    st.json(enriched_data)
+        status, response = _enrich_in_flight.do(lookup_key(payload), lambda: enrich_people(payload))
+        if status != 200 or not isinstance(response, dict):
+            if status == 404: st.warning("🟡 Contact Not Found.")
+            return
 
-    client, db = get_db_connection()
-    if not client: return
-    try:
+        enriched_data = extract_relevant_fields(response, payload)
+        st.markdown("### ✅ Enriched Data:")
+        st.json(enriched_data)
+
+        db[ENRICHMENT_CACHE_COLLECTION].bulk_write([cache_operation(payload, enriched_data)])
         save_to_raw_log(db, enriched_data)
         save_to_cleaned_mongo(db, enriched_data)
     except Exception as error:
         st.error(f"❌ Error during database operation: {error}")
-    finally:
-        client.close()
 
 # ===============================
 # MAIN APP
@@ -184,15 +457,17 @@ def process_enrichment(payload):
 def main():
     st.markdown("<h1>📇 Contact Information Collector</h1>", unsafe_allow_html=True)
     st.markdown("<p style='text-align:center; color:#555;'>Enrich professional data effortlessly using ContactOut API.</p>", unsafe_allow_html=True)
-    setup_database_indexes()
 
     st.divider()
     choice = st.selectbox(
         "Choose an input type to enrich:",
-        ("LinkedIn URL", "Email", "Name + Company", "Company Domain")
+        ("LinkedIn URL", "Email", "Name + Company", "Company Domain", "Bulk Upload (CSV / List)")
     )
+    with st.expander("♻️ Lookup cache settings"):
+        max_age_days = st.number_input("Reuse enrichment results newer than (days):", min_value=0, value=ENRICHMENT_CACHE_DAYS)
+        force_refresh = st.checkbox("Force refresh (always call the ContactOut API)")
 
-    include_fields = ["work_email", "personal_email", "phone"]
+    include_fields = INCLUDE_FIELDS
     payload = {}
 
     # Input fields styled in cards
@@ -202,14 +477,14 @@ def main():
             if st.button("✨ Enrich from LinkedIn URL"):
                 if linkedin_url:
                     payload = {"linkedin_url": linkedin_url, "include": include_fields}
-                    process_enrichment(payload)
+                    process_enrichment(payload, max_age_days, force_refresh)
 
         elif choice == 'Email':
             email = st.text_input("📧 Enter Email Address:")
             if st.button("✨ Enrich from Email"):
                 if email:
                     payload = {"email": email, "include": include_fields}
-                    process_enrichment(payload)
+                    process_enrichment(payload, max_age_days, force_refresh)
 
         elif choice == 'Name + Company':
             name = st.text_input("👤 Full Name:")
@@ -217,14 +492,26 @@ def main():
             if st.button("✨ Enrich from Name + Company"):
                 if name and company:
                     payload = {"full_name": name, "company": [company], "include": include_fields}
-                    process_enrichment(payload)
+                    process_enrichment(payload, max_age_days, force_refresh)
 
         elif choice == 'Company Domain':
             domain = st.text_input("🌐 Company Domain (e.g. apple.com):")
             if st.button("✨ Enrich from Company Domain"):
                 if domain:
                     payload = {"company_domain": domain, "include": include_fields}
-                    process_enrichment(payload)
+                    process_enrichment(payload, max_age_days, force_refresh)
+
+        elif choice == 'Bulk Upload (CSV / List)':
+            uploaded_csv = st.file_uploader("📄 Upload a CSV with linkedin_url, email, full_name + company or company_domain columns:", type="csv")
+            pasted = st.text_area("📋 Or paste one LinkedIn URL, email, \"Name, Company\" or domain per line:", height=150)
+            if st.button("✨ Enrich All"):
+                payloads = payloads_from_csv(pd.read_csv(uploaded_csv)) if uploaded_csv else []
+                payloads += [payload for payload in map(payload_from_line, pasted.splitlines()) if payload]
+                if payloads:
+                    st.caption(f"Rate limit: {CONTACTOUT_RATE_PER_MINUTE} requests/minute, {CONTACTOUT_MAX_CONCURRENCY} in parallel.")
+                    process_bulk_enrichment(payloads, max_age_days, force_refresh)
+                else:
+                    st.warning("⚠️ No valid input provided.")
 
     
 
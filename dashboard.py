@@ -1,13 +1,11 @@
 import streamlit as st
 import pandas as pd
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
 import plotly.express as px
 import time
 import datetime
-import os
 from dotenv import load_dotenv
 from zoneinfo import ZoneInfo # For modern timezone handling
+from database import get_db
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,32 +13,18 @@ load_dotenv()
 # ===============================
 # CONFIGURATION
 # ===============================
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 DISPLAY_TIMEZONE = "Asia/Kolkata" # Set the target timezone for display
 
 # ===============================
 # DATABASE FUNCTIONS
 # ===============================
-@st.cache_resource
-def init_connection():
-    """Initializes and returns a MongoDB client."""
-    try:
-        client = MongoClient(MONGO_URI)
-        client.admin.command('ismaster')
-        return client
-    except ConnectionFailure as e:
-        st.error(f"❌ **Database Connection Error:** {e}")
-        return None
-
 @st.cache_data(ttl=10)
-def load_data(_client):
+def load_data(_db):
     """Loads email log data from MongoDB and converts timestamps to the local timezone."""
-    if _client is None:
+    if _db is None:
         return pd.DataFrame()
     try:
-        db = _client[MONGO_DB_NAME]
-        cursor = db.email_logs.find().sort('timestamp', -1)
+        cursor = _db.email_logs.find().sort('timestamp', -1)
         df = pd.DataFrame(list(cursor))
         if not df.empty and 'timestamp' in df.columns:
             df['timestamp'] = pd.to_datetime(df['timestamp']).dt.tz_localize('UTC').dt.tz_convert(DISPLAY_TIMEZONE)
@@ -50,19 +34,18 @@ def load_data(_client):
         return pd.DataFrame()
 
 @st.cache_data(ttl=10)
-def load_unsubscribe_count(_client):
+def load_unsubscribe_count(_db):
     """
     Loads the total number of unsubscribes by summing counts from both
     'unsubscribe_list' and 'unsubscribed_emails' collections.
     """
-    if _client is None:
+    if _db is None:
         return 0
     try:
-        db = _client[MONGO_DB_NAME]
         # Count documents in the first collection
-        count_from_list = db.unsubscribe_list.count_documents({})
+        count_from_list = _db.unsubscribe_list.count_documents({})
         # Count documents in the second collection
-        count_from_emails = db.unsubscribed_emails.count_documents({})
+        count_from_emails = _db.unsubscribed_emails.count_documents({})
         # Return the sum of both counts
         total_unsubscribes = count_from_list + count_from_emails
         return total_unsubscribes
@@ -82,11 +65,11 @@ def main():
 
     last_updated_placeholder = st.empty()
     
-    mongo_client = init_connection()
-    df = load_data(mongo_client)
-    total_unsubscribes = load_unsubscribe_count(mongo_client)
+    db = get_db()
+    df = load_data(db)
+    total_unsubscribes = load_unsubscribe_count(db)
 
-    if mongo_client and df.empty:
+    if db is not None and df.empty:
         st.info("No email data to display yet. Send some emails and process replies to see the dashboard.")
         time.sleep(auto_refresh_interval)
         st.rerun()
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+import streamlit as st
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, PyMongoError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ===============================
+# CONFIGURATION
+# ===============================
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 2))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 5 * 60 * 1000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+HEALTH_CHECK_INTERVAL_SECONDS = 60
+DUPLICATE_KEY_ERROR = 11000
+
+# ===============================
+# SHARED CLIENT
+# ===============================
+_client = None
+_client_lock = threading.Lock()
+_last_healthy_at = None
+
+def get_client():
+    """
+    Returns the process-wide MongoClient, created on first use. Every page, thread and
+    the scrape worker share its connection pool; it is never closed per request.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MongoClient(
+                MONGO_URI,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                appname="morphius-email-automator"
+            )
+        return _client
+
+def check_health(client):
+    """Pings the server at most once per HEALTH_CHECK_INTERVAL_SECONDS, or again after a failure."""
+    global _last_healthy_at
+    now = time.monotonic()
+    if _last_healthy_at is not None and now - _last_healthy_at < HEALTH_CHECK_INTERVAL_SECONDS:
+        return
+    client.admin.command('ping')
+    _last_healthy_at = now
+
+def get_db():
+    """Returns the application database, or None after showing an error if MongoDB is unreachable."""
+    global _last_healthy_at
+    try:
+        client = get_client()
+        check_health(client)
+        return client[MONGO_DB_NAME]
+    except PyMongoError as e:
+        _last_healthy_at = None
+        st.error(f"❌ **Database Connection Error:** {e}")
+        return None
+
+# ===============================
+# BULK WRITES
+# ===============================
+def new_write_summary(*extra_counts):
+    """Counters filled in by flush_bulk; `extra_counts` names additional `matched_key` counters."""
+    summary = {"raw_logged": 0, "inserted": 0, "duplicates": 0, "errors": 0, "error_messages": []}
+    summary.update({key: 0 for key in extra_counts})
+    return summary
+
+def flush_bulk(collection, operations, summary, matched_key="duplicates"):
+    """
+    Sends the buffered operations as one unordered bulk_write and adds the counts to
+    `summary`. Matched upserts are counted under `matched_key`; duplicate-key failures on
+    the unique source_url index count as duplicates.
+    """
+    if not operations:
+        return
+    batch = list(operations)
+    operations.clear()
+    try:
+        result = collection.bulk_write(batch, ordered=False)
+        counts = {"nInserted": result.inserted_count, "nUpserted": result.upserted_count, "nMatched": result.matched_count}
+        write_errors = []
+    except BulkWriteError as e:
+        counts = e.details
+        write_errors = e.details.get("writeErrors", [])
+    except Exception as e:
+        summary["errors"] += len(batch)
+        summary["error_messages"].append(str(e))
+        return
+    duplicate_errors = sum(1 for error in write_errors if error.get("code") == DUPLICATE_KEY_ERROR)
+    summary["raw_logged"] += counts.get("nInserted", 0)
+    summary["inserted"] += counts.get("nUpserted", 0)
+    summary[matched_key] += counts.get("nMatched", 0)
+    summary["duplicates"] += duplicate_errors
+    summary["errors"] += len(write_errors) - duplicate_errors
+    summary["error_messages"].extend(error.get("errmsg", "") for error in write_errors if error.get("code") != DUPLICATE_KEY_ERROR)
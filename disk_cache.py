@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+# ===============================
+# DISK CACHE
+# ===============================
+class DiskCache:
+    """
+    JSON-on-disk key/value cache. Each entry is one file named after the hash of its key.
+    Entries older than `ttl` seconds are reported as stale, and once the directory grows
+    past `max_bytes` the least recently used files are evicted.
+    """
+
+    def __init__(self, directory, ttl, max_bytes):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._size = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def record(self, event):
+        with self._lock:
+            self.stats[event] += 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats.clear()
+
+    def is_fresh(self, entry):
+        return time.time() - entry["stored_at"] < self.ttl
+
+    def get_entry(self, key):
+        """Returns the stored entry ({"stored_at", "value"}) even when stale, or None."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)  # Bump the mtime so eviction is least-recently-used
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def get(self, key):
+        """Returns the cached value if it is still fresh, otherwise None."""
+        entry = self.get_entry(key)
+        if entry is not None and self.is_fresh(entry):
+            self.record("hits")
+            return entry["value"]
+        self.record("misses")
+        return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"stored_at": time.time(), "value": value}, f, default=str)
+            new_size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += new_size - old_size
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _scan_size(self):
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                total += entry.stat().st_size
+        return total
+
+    def evict(self):
+        """Removes least recently used entries until the cache is back under 90% of max_bytes."""
+        with self._lock:
+            files = [entry for entry in os.scandir(self.directory) if entry.is_file() and entry.name.endswith(".json")]
+            files.sort(key=lambda entry: entry.stat().st_mtime)
+            total = sum(entry.stat().st_size for entry in files)
+            target = self.max_bytes * 0.9
+            for entry in files:
+                if total <= target:
+                    break
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                    total -= size
+                    self.stats["evictions"] += 1
+                except OSError:
+                    pass
+            self._size = total
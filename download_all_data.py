@@ -1,9 +1,21 @@
 import streamlit as st
 import pandas as pd
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
 import os
+import csv
+import gzip
+import io
+import json
+import tempfile
+import datetime as dt
+from bson import ObjectId
 from dotenv import load_dotenv
+from database import get_db
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None  # Parquet export is optional; CSV still works without pyarrow
 
 # Load environment variables
 load_dotenv()
@@ -11,54 +23,289 @@ load_dotenv()
 # ===============================
 # CONFIGURATION
 # ===============================
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 # Add "unsubscribed_emails" to this list
 COLLECTION_NAMES = ["cleaned_contacts", "contacts", "scraped_contacts", "email_logs", "unsubscribe_list", "unsubscribed_emails"]
+EXPORT_BATCH_SIZE = 2000
+SPOOL_MAX_MEMORY_BYTES = 8 * 1024 * 1024  # Larger exports spill from memory to a temp file on disk
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+EXPORT_WATERMARKS_COLLECTION = "export_watermarks"
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
 
 # ===============================
 # DATABASE & DATA FUNCTIONS
 # ===============================
-def get_db_connection():
-    """Establishes a connection to the MongoDB database."""
-    try:
-        client = MongoClient(MONGO_URI)
-        client.admin.command('ismaster')
-        db = client[MONGO_DB_NAME]
-        return client, db
-    except ConnectionFailure:
-        st.error("❌ **Database Connection Error:** Could not connect to MongoDB.")
-        return None, None
-
-def fetch_all_data(db, collection_name):
-    """Fetches all records from a specified collection."""
+@st.cache_data(ttl=300)
+def fetch_field_names(_db, collection_name):
+    """Lists every field used in a collection, computed on the server so no documents are loaded here."""
     try:
-        cursor = db[collection_name].find()
-        df = pd.DataFrame(list(cursor))
-        if '_id' in df.columns:
-            df['_id'] = df['_id'].astype(str) # Convert ObjectId to string
-        return df
+        pipeline = [
+            {"$project": {"fields": {"$objectToArray": "$$ROOT"}}},
+            {"$unwind": "$fields"},
+            {"$group": {"_id": "$fields.k"}}
+        ]
+        names = sorted(doc["_id"] for doc in _db[collection_name].aggregate(pipeline))
+        return (["_id"] if "_id" in names else []) + [name for name in names if name != "_id"]
     except Exception as e:
-        st.warning(f"⚠️ Could not fetch data from '{collection_name}'. It might be empty. Error: {e}")
-        return pd.DataFrame()
+        st.warning(f"⚠️ Could not read the fields of '{collection_name}'. Error: {e}")
+        return []
+
+def fetch_preview(db, collection_name, fields, limit=5):
+    """Fetches the first few documents for an on-page preview."""
+    docs = list(db[collection_name].find({}, {field: 1 for field in fields}).limit(limit))
+    return pd.DataFrame([{field: format_csv_value(doc.get(field)) for field in fields} for doc in docs])
+
+def format_csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=str)
+    return str(value)  # ObjectId, datetime and numbers as text
+
+def export_collection_csv(db, collection_name, fields, compress=False):
+    """
+    Streams a collection to CSV one cursor batch at a time into a spooled temporary file,
+    optionally gzip-compressed, so memory use stays flat whatever the collection size.
+    Returns (file object positioned at the start, number of rows written).
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_BYTES)
+    raw_stream = gzip.GzipFile(fileobj=spool, mode="wb") if compress else spool
+    text_stream = io.TextIOWrapper(raw_stream, encoding="utf-8", newline="")
+    writer = csv.writer(text_stream)
+    writer.writerow(fields)
+
+    row_count = 0
+    cursor = db[collection_name].find({}, {field: 1 for field in fields}).batch_size(EXPORT_BATCH_SIZE)
+    for doc in cursor:
+        writer.writerow([format_csv_value(doc.get(field)) for field in fields])
+        row_count += 1
+
+    text_stream.flush()
+    text_stream.detach()  # Keep the underlying stream open
+    if compress:
+        raw_stream.close()  # Writes the gzip trailer; the spool itself stays open
+    spool.seek(0)
+    return spool, row_count
+
+# ===============================
+# PARQUET EXPORT
+# ===============================
+def arrow_type_name(value):
+    """Maps a BSON value to the name of the Arrow column type it is stored as."""
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int64"
+    if isinstance(value, float):
+        return "float64"
+    if isinstance(value, dt.datetime):
+        return "timestamp"
+    return "string"  # ObjectId, text, and nested lists/dicts as JSON
+
+def widen_column_type(current, seen):
+    """Narrowest type that holds both; mixed numbers widen to float, anything else mixed becomes text."""
+    if current is None or current == seen:
+        return seen
+    if {current, seen} == {"int64", "float64"}:
+        return "float64"
+    return "string"
+
+def infer_column_types(docs, fields, column_types=None):
+    """Widens `column_types` (if given) just enough that every value in `docs` fits; never narrows."""
+    widened = dict(column_types or {})
+    for field in fields:
+        current = widened.get(field)
+        for doc in docs:
+            if doc.get(field) is not None:
+                current = widen_column_type(current, arrow_type_name(doc[field]))
+        widened[field] = current or "string"
+    widened["_id"] = "string"
+    return widened
+
+def build_arrow_schema(fields, column_types):
+    arrow_types = {
+        "bool": pa.bool_(), "int64": pa.int64(), "float64": pa.float64(),
+        "timestamp": pa.timestamp("ms", tz="UTC"), "string": pa.string()
+    }
+    return pa.schema([(field, arrow_types[column_types[field]]) for field in fields])
+
+def to_arrow_value(value, type_name):
+    """Coerces a value to its column type. Columns are widened before writing, so a misfit is a bug and fails loudly."""
+    if value is None:
+        return None
+    if type_name == "string":
+        return format_csv_value(value)
+    if arrow_type_name(value) == type_name:
+        return value
+    if type_name == "float64" and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    raise ValueError(f"{type(value).__name__} value does not fit a {type_name} column")
+
+class ColumnTypesChanged(Exception):
+    """A batch holds values that need wider column types than the ones already written."""
+    def __init__(self, column_types):
+        super().__init__("Parquet column types changed during export")
+        self.column_types = column_types
+
+def get_export_watermark(db, collection_name):
+    return db[EXPORT_WATERMARKS_COLLECTION].find_one({"_id": collection_name})
+
+def write_parquet_file(cursor, path, fields, column_types=None, fixed_types=False):
+    """
+    Writes a cursor to one Parquet file, a row group per batch. Column types start from `column_types`
+    and widen as batches need it; if a batch needs wider types after rows were written (or at all with
+    `fixed_types`), the file is removed and ColumnTypesChanged carries the wider types for a rewrite.
+    Returns (rows written, last _id, column types).
+    """
+    writer = None
+    row_count = 0
+    last_id = None
+    try:
+        for batch in iter_batches(cursor):
+            widened = infer_column_types(batch, fields, column_types)
+            if widened != column_types and (writer is not None or fixed_types):
+                if writer is not None:
+                    writer.close()
+                    writer = None
+                    os.remove(path)
+                raise ColumnTypesChanged(widened)
+            column_types = widened
+            schema = build_arrow_schema(fields, column_types)
+            if writer is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                writer = pq.ParquetWriter(path, schema, compression=PARQUET_COMPRESSION)
+            columns = {field: [to_arrow_value(doc.get(field), column_types[field]) for doc in batch] for field in fields}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            row_count += len(batch)
+            last_id = batch[-1]["_id"]
+    finally:
+        if writer is not None:
+            writer.close()
+    return row_count, last_id, column_types
+
+def iter_batches(cursor):
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def export_collection_parquet(db, collection_name, fields, incremental=False):
+    """
+    Writes a collection to Parquet under EXPORT_DIR/<collection>/. A full snapshot starts a new
+    snapshot-<time>/ folder; incremental exports add part files to the latest snapshot folder with only
+    the documents whose _id is above the watermark (ObjectIds grow with insert time), using the same
+    columns and types so each folder reads as one dataset. New values that no longer fit those types
+    turn the export into a fresh snapshot instead of being dropped.
+    Returns (file path or None, number of rows written, whether a snapshot was written).
+    """
+    def find(query):
+        return db[collection_name].find(query, {field: 1 for field in fields}).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
 
-@st.cache_data
-def convert_df_to_csv(df):
-    """Caches the conversion of a DataFrame to a CSV string to improve performance."""
-    return df.to_csv(index=False).encode('utf-8')
+    started_at = dt.datetime.now(dt.timezone.utc)
+    file_name = f"part-{started_at:%Y%m%dT%H%M%S%f}.parquet"
+    watermark = get_export_watermark(db, collection_name) if incremental else None
+
+    if watermark and watermark.get("folder"):
+        fields = watermark["fields"]
+        part_path = os.path.join(EXPORT_DIR, collection_name, watermark["folder"], file_name)
+        try:
+            row_count, last_id, column_types = write_parquet_file(
+                find({"_id": {"$gt": watermark["last_id"]}}), part_path, fields, watermark["column_types"], fixed_types=True
+            )
+            if not row_count:
+                return None, 0, False
+            if isinstance(last_id, ObjectId):
+                db[EXPORT_WATERMARKS_COLLECTION].update_one(
+                    {"_id": collection_name},
+                    {
+                        "$set": {"last_id": last_id, "exported_at": started_at},
+                        "$push": {"parts": {"file": file_name, "rows": row_count, "exported_at": started_at}}
+                    }
+                )
+            return part_path, row_count, False
+        except ColumnTypesChanged:
+            pass  # The earlier parts have narrower columns; start a new snapshot with the current data
+
+    folder = f"snapshot-{started_at:%Y%m%dT%H%M%S%f}"
+    snapshot_path = os.path.join(EXPORT_DIR, collection_name, folder, file_name)
+    column_types = None
+    while True:
+        try:
+            row_count, last_id, column_types = write_parquet_file(find({}), snapshot_path, fields, column_types)
+            break
+        except ColumnTypesChanged as changed:
+            column_types = changed.column_types  # Rewrite from the start with the wider columns
+
+    if not row_count:
+        return None, 0, True
+
+    # Only move the watermark once the snapshot is complete; its folder replaces the previous parts
+    if isinstance(last_id, ObjectId):
+        db[EXPORT_WATERMARKS_COLLECTION].update_one(
+            {"_id": collection_name},
+            {"$set": {
+                "folder": folder, "last_id": last_id, "fields": fields, "column_types": column_types, "exported_at": started_at,
+                "parts": [{"file": file_name, "rows": row_count, "exported_at": started_at}]
+            }},
+            upsert=True
+        )
+    return snapshot_path, row_count, True
 
 # ===============================
 # STREAMLIT UI
 # ===============================
+def render_parquet_export(db, collection_name, all_fields):
+    """Parquet export controls: a full snapshot or an incremental part file since the last export."""
+    if pa is None:
+        st.warning("⚠️ Parquet export needs the 'pyarrow' package. Install it with `pip install pyarrow`.")
+        return
+
+    watermark = get_export_watermark(db, collection_name)
+    incremental = False
+    if watermark and watermark.get("folder"):
+        st.caption(
+            f"Last export: {watermark['exported_at']:%Y-%m-%d %H:%M} UTC, "
+            f"{len(watermark.get('parts', []))} part file(s) in `{os.path.join(EXPORT_DIR, collection_name, watermark['folder'])}`."
+        )
+        incremental = st.checkbox("Incremental: only documents added since the last export", value=True)
+
+    if incremental:
+        fields = watermark["fields"]
+        st.caption("Incremental exports keep the columns of the previous export: " + ", ".join(fields))
+    else:
+        fields = st.multiselect("Columns to export:", all_fields, default=all_fields)
+
+    if st.button(f"Export '{collection_name}' to Parquet", disabled=not fields):
+        with st.spinner(f"Exporting data from '{collection_name}'..."):
+            part_path, row_count, snapshot = export_collection_parquet(db, collection_name, fields, incremental)
+
+        if not row_count:
+            st.info("ℹ️ No new documents since the last export." if incremental else "ℹ️ This collection is currently empty. No data to export.")
+            return
+
+        if incremental and snapshot:
+            st.warning("⚠️ New documents no longer fit the column types of the earlier parts, so a fresh full snapshot was written instead.")
+        st.success(f"✅ Wrote {row_count} records to `{part_path}`.")
+        with open(part_path, "rb") as part_file:
+            st.download_button(
+                label=f"Download {os.path.basename(part_path)}",
+                data=part_file,
+                file_name=f"{collection_name}-{os.path.basename(part_path)}",
+                mime="application/vnd.apache.parquet",
+            )
+
 def main():
     """
     Main function to display the download page.
     """
     st.title("📥 Download All Collected Data")
-    st.markdown("Here you can download the data from your various database collections as a CSV file.")
+    st.markdown("Here you can download the data from your various database collections as a CSV or Parquet file.")
 
-    client, db = get_db_connection()
-    if not client:
+    db = get_db()
+    if db is None:
         return
 
     # Let the user choose which collection to download
@@ -67,22 +314,34 @@ def main():
         COLLECTION_NAMES
     )
 
-    if st.button(f"Prepare '{selected_collection}' for Download"):
-        with st.spinner(f"Fetching data from '{selected_collection}'..."):
-            df = fetch_all_data(db, selected_collection)
-            client.close()
+    all_fields = fetch_field_names(db, selected_collection)
+    if not all_fields:
+        st.info("ℹ️ This collection is currently empty. No data to download.")
+        return
+
+    export_format = st.radio("Export format:", ["CSV", "Parquet"], horizontal=True)
+    if export_format == "Parquet":
+        render_parquet_export(db, selected_collection, all_fields)
+        return
+
+    # Only the chosen fields are read from the database (projection)
+    fields = st.multiselect("Columns to export:", all_fields, default=all_fields)
+    compress = st.checkbox("Compress with gzip (.csv.gz)")
 
-            if not df.empty:
-                st.success(f"✅ Successfully fetched {len(df)} records.")
-                st.dataframe(df.head()) # Show a preview
+    if st.button(f"Prepare '{selected_collection}' for Download", disabled=not fields):
+        with st.spinner(f"Exporting data from '{selected_collection}'..."):
+            csv_file, row_count = export_collection_csv(db, selected_collection, fields, compress)
 
-                csv_data = convert_df_to_csv(df)
+            if row_count:
+                st.success(f"✅ Successfully exported {row_count} records.")
+                st.dataframe(fetch_preview(db, selected_collection, fields)) # Show a preview
 
+                extension = "csv.gz" if compress else "csv"
                 st.download_button(
-                    label=f"Download {selected_collection}.csv",
-                    data=csv_data,
-                    file_name=f"{selected_collection}.csv",
-                    mime="text/csv",
+                    label=f"Download {selected_collection}.{extension}",
+                    data=csv_file,
+                    file_name=f"{selected_collection}.{extension}",
+                    mime="application/gzip" if compress else "text/csv",
                 )
             else:
                 st.info("ℹ️ This collection is currently empty. No data to download.")
@@ -0,0 +1,125 @@
+import datetime
+import uuid
+import streamlit as st
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+# ===============================
+# CONFIGURATION
+# ===============================
+DRAFTS_COLLECTION = "drafts"
+DRAFT_INSERT_BATCH_SIZE = 500
+DRAFT_CURSOR_BATCH_SIZE = 200
+DRAFT_SEND_PAGE_SIZE = 50
+OWNER_QUERY_PARAM = "draft_owner"
+
+# ===============================
+# OWNER
+# ===============================
+# The app has no logins, so each browser gets a random owner token kept in the page URL.
+# Reloading (or bookmarking) the page resumes that owner's drafts; other users never see them.
+
+def get_draft_owner():
+    owner = st.session_state.get('draft_owner') or st.query_params.get(OWNER_QUERY_PARAM)
+    if not owner:
+        owner = uuid.uuid4().hex
+    st.session_state.draft_owner = owner
+    if st.query_params.get(OWNER_QUERY_PARAM) != owner:
+        st.query_params[OWNER_QUERY_PARAM] = owner
+    return owner
+
+# ===============================
+# DRAFT STORE
+# ===============================
+# A campaign is one batch of generated drafts. Each draft references its contact by
+# `contact_id` and keeps a dense `position` within the campaign, so pages are index range
+# scans instead of skips. Sessions only hold the campaign id and the page number.
+
+def now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def new_draft(contact_id, name, to_email, subject, body):
+    return {"contact_id": contact_id, "name": name, "to_email": to_email, "subject": subject, "body": body}
+
+def create_campaign(db, drafts, owner):
+    """Stores `drafts` (dicts from new_draft) in order under a new campaign id owned by `owner` and returns it."""
+    campaign_id = ObjectId()
+    created_at = now()
+    batch = []
+    for position, draft in enumerate(drafts):
+        batch.append({
+            **draft, "campaign_id": campaign_id, "owner": owner, "position": position,
+            "status": "draft", "regen_count": 0, "created_at": created_at, "updated_at": created_at
+        })
+        if len(batch) >= DRAFT_INSERT_BATCH_SIZE:
+            db[DRAFTS_COLLECTION].insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        db[DRAFTS_COLLECTION].insert_many(batch, ordered=False)
+    return campaign_id
+
+def discard_unsent_drafts(db, campaign_id, owner):
+    """Deletes an owner's never-sent drafts of a campaign; sent and failed ones stay for the record."""
+    if campaign_id is not None:
+        db[DRAFTS_COLLECTION].delete_many({"campaign_id": campaign_id, "owner": owner, "status": "draft"})
+
+def latest_open_campaign(db, owner):
+    """The owner's newest campaign that still has unsent drafts, so work survives a lost session."""
+    doc = db[DRAFTS_COLLECTION].find_one({"owner": owner, "status": "draft"}, {"campaign_id": 1}, sort=[("campaign_id", -1)])
+    return doc["campaign_id"] if doc else None
+
+def count_drafts(db, campaign_id, status=None):
+    query = {"campaign_id": campaign_id}
+    if status:
+        query["status"] = status
+    return db[DRAFTS_COLLECTION].count_documents(query)
+
+def campaign_size(db, campaign_id):
+    """Number of positions in a campaign, read from its last draft instead of counting."""
+    last = db[DRAFTS_COLLECTION].find_one({"campaign_id": campaign_id}, {"position": 1}, sort=[("position", -1)])
+    return last["position"] + 1 if last else 0
+
+def fetch_drafts_page(db, campaign_id, page, page_size):
+    """One page of a campaign's drafts in generation order (page numbers start at 0)."""
+    query = {"campaign_id": campaign_id, "position": {"$gte": page * page_size, "$lt": (page + 1) * page_size}}
+    return list(db[DRAFTS_COLLECTION].find(query).sort("position", 1))
+
+def iter_drafts(db, campaign_id, status=None, projection=None):
+    """Streams a campaign's drafts in order without loading them all at once."""
+    query = {"campaign_id": campaign_id}
+    if status:
+        query["status"] = status
+    return db[DRAFTS_COLLECTION].find(query, projection).sort("position", 1).batch_size(DRAFT_CURSOR_BATCH_SIZE)
+
+def iter_unsent_drafts(db, campaign_id, page_size=DRAFT_SEND_PAGE_SIZE):
+    """
+    Yields a campaign's unsent drafts in order, re-querying one small page at a time after the
+    last position seen. No cursor stays open while the caller works (slow SMTP sends would let
+    it pass the server's idle-cursor timeout).
+    """
+    last_position = -1
+    while True:
+        query = {"campaign_id": campaign_id, "status": "draft", "position": {"$gt": last_position}}
+        page = list(db[DRAFTS_COLLECTION].find(query).sort("position", 1).limit(page_size))
+        if not page:
+            return
+        yield from page
+        last_position = page[-1]["position"]
+
+def update_draft(db, draft_id, **fields):
+    db[DRAFTS_COLLECTION].update_one({"_id": draft_id}, {"$set": {**fields, "updated_at": now()}})
+
+def replace_draft_body(db, draft_id, body):
+    """Sets a new body and bumps `regen_count`. Returns the updated draft."""
+    return db[DRAFTS_COLLECTION].find_one_and_update(
+        {"_id": draft_id},
+        {"$set": {"body": body, "updated_at": now()}, "$inc": {"regen_count": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+
+def mark_draft(db, draft_id, status):
+    """Records a send result ("sent" or "failed") so an interrupted send can resume."""
+    fields = {"status": status, "updated_at": now()}
+    if status == "sent":
+        fields["sent_at"] = fields["updated_at"]
+    db[DRAFTS_COLLECTION].update_one({"_id": draft_id}, {"$set": fields})
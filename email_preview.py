@@ -1,12 +1,13 @@
 import streamlit as st
 import smtplib
 import datetime
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
+import math
 from dotenv import load_dotenv
+from database import get_db
+from draft_store import get_draft_owner, latest_open_campaign, campaign_size, count_drafts, fetch_drafts_page, iter_unsent_drafts, mark_draft
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,28 +15,16 @@ load_dotenv()
 # ===============================
 # CONFIGURATION
 # ===============================
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 SMTP_SERVER = os.getenv("SMTP_SERVER")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 SENDER_EMAIL = os.getenv("SENDER_EMAIL")
 SENDER_PASSWORD = os.getenv("SENDER_PASSWORD")
+PREVIEW_PAGE_SIZE = 20
 
 # ===============================
 # HELPER FUNCTIONS
 # ===============================
 
-def get_db_connection():
-    """Establishes connection to the MongoDB database."""
-    try:
-        client = MongoClient(MONGO_URI)
-        client.admin.command('ismaster')
-        db = client[MONGO_DB_NAME]
-        return client, db
-    except ConnectionFailure as e:
-        st.error(f"❌ **Database Connection Error:** {e}")
-        return None, None
-
 def log_event_to_db(db, event_type, email_addr, subject, body, status):
     """Inserts an email event document into the 'email_logs' collection."""
     try:
@@ -80,39 +69,50 @@ def send_email_smtp(db, to_email, subject, body):
 def main():
     st.title("Email Preview & Send")
 
-    if 'edited_emails' not in st.session_state or not st.session_state.edited_emails:
+    db = get_db()
+    if db is None:
+        st.error("Cannot preview or send emails without a database connection.")
+        return
+
+    # The campaign being edited on the 'Generate & Edit Emails' page, or the newest one left unsent
+    campaign_id = st.session_state.get('draft_campaign_id') or latest_open_campaign(db, get_draft_owner())
+    pending = count_drafts(db, campaign_id, status="draft") if campaign_id else 0
+    if not pending:
         st.info("📧 Please generate and edit some email drafts on the 'Generate & Edit Emails' page first.")
         return
 
     st.header("Final Review")
     st.info("This is a read-only preview of the emails that will be sent. Review them carefully.")
 
-    for email in st.session_state.edited_emails:
+    total = campaign_size(db, campaign_id)
+    page_count = math.ceil(total / PREVIEW_PAGE_SIZE)
+    page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, step=1) - 1
+    for email in fetch_drafts_page(db, campaign_id, page, PREVIEW_PAGE_SIZE):
         st.markdown("---")
         st.markdown(f"**To:** {email['name']} <{email['to_email']}>")
         st.markdown(f"**Subject:** {email['subject']}")
-        st.text_area("Body Preview", value=email['body'], height=200, disabled=True, key=f"preview_{email['id']}")
+        if email['status'] != "draft":
+            st.caption(f"Status: {email['status']}")
+        st.text_area("Body Preview", value=email['body'], height=200, disabled=True, key=f"preview_{email['_id']}")
     
     st.markdown("---")
     
-    if st.button(f"🚀 Send {len(st.session_state.edited_emails)} Emails Now", type="primary"):
-        client, db = get_db_connection()
-        if not client:
-            st.error("Cannot send emails without a database connection for logging.")
-            return
-        
+    if st.button(f"🚀 Send {pending} Emails Now", type="primary"):
         success_count = 0
         progress_bar = st.progress(0, text="Initializing...")
         
-        for i, email_to_send in enumerate(st.session_state.edited_emails):
-            progress_text = f"Sending email {i+1}/{len(st.session_state.edited_emails)} to {email_to_send['to_email']}..."
-            progress_bar.progress((i + 1) / len(st.session_state.edited_emails), text=progress_text)
+        # Pages through unsent drafts from the store; each is marked as it goes, so a rerun resumes where this stopped
+        for i, email_to_send in enumerate(iter_unsent_drafts(db, campaign_id)):
+            progress_text = f"Sending email {i+1}/{pending} to {email_to_send['to_email']}..."
+            progress_bar.progress(min((i + 1) / pending, 1.0), text=progress_text)
             if send_email_smtp(db, email_to_send['to_email'], email_to_send['subject'], email_to_send['body']):
+                mark_draft(db, email_to_send['_id'], "sent")
                 success_count += 1
+            else:
+                mark_draft(db, email_to_send['_id'], "failed")
         
-        client.close()
-        st.success(f"Campaign complete! Sent {success_count} out of {len(st.session_state.edited_emails)} emails. Full details logged to the database.")
-        st.session_state.edited_emails = []
+        st.success(f"Campaign complete! Sent {success_count} out of {pending} emails. Full details logged to the database.")
+        st.session_state.pop('draft_campaign_id', None)
         st.rerun()
 
 if __name__ == "__main__":
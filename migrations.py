@@ -0,0 +1,147 @@
+import datetime
+import threading
+from pymongo import UpdateOne
+from contact_dedupe import resolve_pending_contacts
+from contact_fields import LINKEDIN_KEY_FIELD, normalize_linkedin_url
+
+# ===============================
+# CONFIGURATION
+# ===============================
+MIGRATIONS_COLLECTION = "schema_migrations"
+SCHEMA_STATE_ID = "schema"
+
+# ===============================
+# MIGRATIONS
+# ===============================
+# Each migration must be idempotent: two processes starting at once may both apply it.
+
+def migration_001_core_indexes(db):
+    """Indexes for the hot lookups, sorts and unique keys used across the pages."""
+    db.cleaned_contacts.create_index("source_url", unique=True)
+    db.cleaned_contacts.create_index("domain")
+    db.unsubscribe_list.create_index("email", unique=True)
+    db.unsubscribed_emails.create_index("email")
+    # find_one by recipient and the per-recipient outreach aggregations
+    db.email_logs.create_index([("recipient_email", 1), ("event_type", 1), ("timestamp", 1)])
+    # distinct(recipient_email) over anchored event_type regexes is answered from this index alone
+    db.email_logs.create_index([("event_type", 1), ("recipient_email", 1)])
+    # $match on event_type followed by $sort on timestamp in the follow-up pipeline
+    db.email_logs.create_index([("event_type", 1), ("timestamp", 1)])
+    # Dashboard activity log, newest first
+    db.email_logs.create_index([("timestamp", -1)])
+    db.scrape_jobs.create_index([("status", 1), ("created_at", 1)])
+    db.enrichment_cache.create_index("fetched_at")
+
+def split_list_expr(field, lowercase):
+    """Aggregation expression turning a comma-joined string field into a trimmed array; arrays pass through."""
+    item = {"$trim": {"input": "$$item"}}
+    return {"$cond": [
+        {"$eq": [{"$type": field}, "string"]},
+        {"$filter": {
+            "input": {"$map": {"input": {"$split": [field, ","]}, "as": "item", "in": {"$toLower": item} if lowercase else item}},
+            "as": "item",
+            "cond": {"$ne": ["$$item", ""]}
+        }},
+        {"$ifNull": [field, []]}
+    ]}
+
+def migration_002_contact_email_arrays(db):
+    """Rewrites comma-joined email/phone strings on cleaned_contacts as arrays and indexes the combined emails."""
+    needs_backfill = {"$or": [
+        {"work_emails": {"$type": "string"}},
+        {"personal_emails": {"$type": "string"}},
+        {"phones": {"$type": "string"}},
+        {"emails": {"$exists": False}}
+    ]}
+    # Pipeline update: the conversion runs on the server without pulling documents out
+    db.cleaned_contacts.update_many(needs_backfill, [
+        {"$set": {
+            "work_emails": split_list_expr("$work_emails", lowercase=True),
+            "personal_emails": split_list_expr("$personal_emails", lowercase=True),
+            "phones": split_list_expr("$phones", lowercase=False)
+        }},
+        {"$set": {"emails": {"$setUnion": ["$work_emails", "$personal_emails"]}}}
+    ])
+    db.cleaned_contacts.create_index("emails")
+
+def migration_003_contact_resolution(db):
+    """Blocking-key and canonical-id indexes, then a first de-duplication pass over every contact."""
+    db.cleaned_contacts.create_index("block_keys")
+    db.cleaned_contacts.create_index("canonical_id")
+    resolve_pending_contacts(db)
+
+def migration_004_draft_store(db):
+    """Indexes for paging, streaming and resuming stored email drafts."""
+    db.drafts.create_index([("campaign_id", 1), ("position", 1)], unique=True)
+    db.drafts.create_index([("campaign_id", 1), ("status", 1), ("position", 1)])
+    db.drafts.create_index([("status", 1), ("campaign_id", -1)])
+
+def migration_005_contact_selection(db):
+    """Indexes behind the filtered contact selection on the Generate & Edit Emails page."""
+    db.cleaned_contacts.create_index([("name", "text"), ("domain", "text")], name="contact_text_search")
+    db.cleaned_contacts.create_index([("source", 1), ("created_at", -1)])
+    db.cleaned_contacts.create_index([("created_at", -1)])
+
+def migration_006_draft_owner(db):
+    """Resuming drafts is now scoped to the browser that created them."""
+    db.drafts.create_index([("owner", 1), ("status", 1), ("campaign_id", -1)])
+
+def migration_007_contact_linkedin_key(db):
+    """Normalized LinkedIn key on ContactOut contacts so cached lookups match however the URL was pasted."""
+    operations = []
+    query = {"source": "ContactOut", "source_url": {"$type": "string"}, LINKEDIN_KEY_FIELD: {"$exists": False}}
+    for doc in db.cleaned_contacts.find(query, {"source_url": 1}):
+        operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": {LINKEDIN_KEY_FIELD: normalize_linkedin_url(doc["source_url"])}}))
+        if len(operations) >= 1000:
+            db.cleaned_contacts.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        db.cleaned_contacts.bulk_write(operations, ordered=False)
+    db.cleaned_contacts.create_index(LINKEDIN_KEY_FIELD)
+
+MIGRATIONS = [
+    (1, "Core indexes for contacts, unsubscribes, email logs and jobs", migration_001_core_indexes),
+    (2, "Email and phone arrays on cleaned contacts with a multikey emails index", migration_002_contact_email_arrays),
+    (3, "Cross-source de-duplication: blocking keys and canonical contact ids", migration_003_contact_resolution),
+    (4, "Indexes for the persisted email draft store", migration_004_draft_store),
+    (5, "Text, source and created_at indexes for contact selection", migration_005_contact_selection),
+    (6, "Owner index for resuming email drafts", migration_006_draft_owner),
+    (7, "Normalized LinkedIn key on ContactOut contacts", migration_007_contact_linkedin_key),
+]
+
+# ===============================
+# RUNNER
+# ===============================
+_migrated = False
+_migrate_lock = threading.Lock()
+
+def get_schema_version(db):
+    state = db[MIGRATIONS_COLLECTION].find_one({"_id": SCHEMA_STATE_ID})
+    return state.get("version", 0) if state else 0
+
+def run_migrations(db):
+    """Applies every migration newer than the recorded schema version, recording each one. Returns the version."""
+    version = get_schema_version(db)
+    for migration_version, description, migrate in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        migrate(db)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        db[MIGRATIONS_COLLECTION].update_one(
+            {"_id": SCHEMA_STATE_ID},
+            {"$set": {"version": migration_version, "updated_at": now},
+             "$push": {"applied": {"version": migration_version, "description": description, "applied_at": now}}},
+            upsert=True
+        )
+        version = migration_version
+    return version
+
+def ensure_migrated(db):
+    """Runs the migrations once per process; later calls return without touching the database."""
+    global _migrated
+    if _migrated:
+        return
+    with _migrate_lock:
+        if not _migrated:
+            run_migrations(db)
+            _migrated = True
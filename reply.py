@@ -6,12 +6,11 @@ from email.mime.multipart import MIMEMultipart
 import smtplib
 import datetime
 import pandas as pd
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, OperationFailure
 from openai import OpenAI
 import os
 from dotenv import load_dotenv
 from urllib.parse import quote
+from database import get_db
 
 # Load environment variables from .env file
 load_dotenv()
@@ -20,8 +19,6 @@ load_dotenv()
 # CONFIGURATION
 # ===============================
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 EMAIL = os.getenv("SENDER_EMAIL")
 PASSWORD = os.getenv("SENDER_PASSWORD")
 SMTP_SERVER = os.getenv("SMTP_SERVER")
@@ -34,23 +31,6 @@ OTHER_SERVICES_LINK = os.getenv("OTHER_SERVICES_LINK")
 # ===============================
 # DATABASE FUNCTIONS
 # ===============================
-def get_db_connection():
-    try:
-        client = MongoClient(MONGO_URI)
-        client.admin.command('ismaster')
-        db = client[MONGO_DB_NAME]
-        return client, db
-    except ConnectionFailure as e:
-        st.error(f"❌ *Database Connection Error:* {e}")
-        return None, None
-
-def setup_database_indexes(db):
-    """Ensures all required unique indexes exist."""
-    try:
-        db.unsubscribe_list.create_index("email", unique=True)
-    except OperationFailure as e:
-        st.error(f"❌ Failed to set up database indexes: {e}")
-
 def log_event_to_db(db, event_type, email_addr, subject, status=None, interest_level=None, mail_id=None, body=None):
     try:
         log_entry = {
@@ -265,9 +245,8 @@ def process_unsubscribes(db):
 # ===============================
 def main():
     st.title("Automated Reply Handler")
-    client, db = get_db_connection()
-    if not client: return
-    setup_database_indexes(db)
+    db = get_db()
+    if db is None: return
 
     if st.button("Check Emails & Run Automations"):
         with st.spinner("Processing all tasks..."):
@@ -311,8 +290,6 @@ def main():
             st.success("✅ All automated tasks complete.")
             st.markdown("---")
 
-    client.close()
-
 if __name__ == "__main__":
     main()
 
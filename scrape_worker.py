@@ -0,0 +1,88 @@
+"""
+Background worker for AI Web Scraper jobs.
+
+    python scrape_worker.py
+
+Claims queued jobs from the `scrape_jobs` collection one at a time and runs them outside
+the Streamlit process, so scrapes survive reruns and closed tabs. Start several workers
+to process several users' jobs in parallel.
+"""
+import datetime
+import os
+import socket
+import time
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from database import get_client, MONGO_DB_NAME
+from migrations import ensure_migrated
+from ai_webscraper import SCRAPE_JOBS_COLLECTION, run_scrape_job
+
+# ===============================
+# CONFIGURATION
+# ===============================
+IDLE_POLL_SECONDS = 2
+STALE_JOB_SECONDS = 10 * 60  # A running job without a heartbeat for this long is requeued
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# ===============================
+# JOB QUEUE
+# ===============================
+def claim_next_job(db):
+    """Atomically moves the oldest queued job to running and returns it, or None."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return db[SCRAPE_JOBS_COLLECTION].find_one_and_update(
+        {"status": "queued"},
+        {"$set": {"status": "running", "worker": WORKER_ID, "started_at": now, "heartbeat_at": now}},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def requeue_stale_jobs(db):
+    """Puts jobs back in the queue whose worker stopped sending heartbeats."""
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=STALE_JOB_SECONDS)
+    result = db[SCRAPE_JOBS_COLLECTION].update_many(
+        {"status": "running", "heartbeat_at": {"$lt": cutoff}},
+        {"$set": {"status": "queued", "results": [], "done": 0}, "$unset": {"worker": ""}}
+    )
+    return result.modified_count
+
+def run_next_job(db):
+    """Requeues stale jobs, then claims and runs the next queued job, sleeping when there is none."""
+    requeued = requeue_stale_jobs(db)
+    if requeued:
+        print(f"Requeued {requeued} stale job(s).")
+    job = claim_next_job(db)
+    if not job:
+        time.sleep(IDLE_POLL_SECONDS)
+        return
+    print(f"Running job {job['_id']}: '{job['query']}' ({job['num_results']} results)")
+    try:
+        run_scrape_job(db, job)
+        print(f"Job {job['_id']} completed.")
+    except Exception as e:
+        db[SCRAPE_JOBS_COLLECTION].update_one({"_id": job["_id"]}, {"$set": {
+            "status": "failed", "error": str(e),
+            "finished_at": datetime.datetime.now(datetime.timezone.utc)
+        }})
+        print(f"Job {job['_id']} failed: {e}")
+
+def run_worker():
+    client = get_client()
+    db = client[MONGO_DB_NAME]
+    ensure_migrated(db)
+    print(f"Scrape worker {WORKER_ID} started.")
+    try:
+        while True:
+            try:
+                run_next_job(db)
+            except PyMongoError as e:
+                # A failover or network blip must not stop the worker; the next poll retries
+                print(f"Database error, retrying in {IDLE_POLL_SECONDS}s: {e}")
+                time.sleep(IDLE_POLL_SECONDS)
+    except KeyboardInterrupt:
+        print("Scrape worker stopped.")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    run_worker()
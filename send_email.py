@@ -1,94 +1,197 @@
 import streamlit as st
 import pandas as pd
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
 from io import StringIO
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
 import os
+import csv
+import json
+import math
+import re
+import datetime
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from urllib.parse import quote
+from bson import ObjectId
+from database import get_db
+from disk_cache import DiskCache
+from draft_store import (
+    get_draft_owner, new_draft, create_campaign, discard_unsent_drafts, latest_open_campaign, campaign_size,
+    fetch_drafts_page, iter_drafts, update_draft, replace_draft_body
+)
+from contact_fields import LIST_FIELDS, ALL_EMAILS_FIELD, exact_email_regex, join_values, primary_email
 
 # ===============================
 # LOAD CONFIG
 # ===============================
 load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
-client_ai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client_ai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)  # Retries are handled in request_email_body
+CONTACT_COLLECTIONS = ["cleaned_contacts", "unsubscribed_emails", "unsubscribe_list"]
+CONTACT_SPLIT_TTL_SECONDS = 600  # Backstop for in-place edits the version token cannot see
+
+# Parallel gpt-4o calls when generating drafts; keep below the account's rate limit
+DRAFT_MAX_CONCURRENCY = int(os.getenv("DRAFT_MAX_CONCURRENCY", 8))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 4))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+RETRYABLE_OPENAI_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+DRAFT_MODEL = "gpt-4o"
+DRAFT_TEMPERATURE = 0.75
+DRAFT_MAX_TOKENS = 300
+DRAFT_SYSTEM_PROMPT = "You are a business development assistant. Only output the email body."
+
+# Generated bodies are reused for identical requests, so reruns and resumed batches cost nothing
+DRAFT_CACHE_DIR = os.getenv("DRAFT_CACHE_DIR", ".cache/drafts")
+DRAFT_CACHE_TTL = int(os.getenv("DRAFT_CACHE_TTL_DAYS", 14)) * 24 * 3600
+DRAFT_CACHE_MAX_BYTES = int(os.getenv("DRAFT_CACHE_MAX_MB", 50)) * 1024 * 1024
+DRAFT_CACHE = DiskCache(DRAFT_CACHE_DIR, DRAFT_CACHE_TTL, DRAFT_CACHE_MAX_BYTES)
+
+# Segment mode: one LLM template per segment, filled in locally for each contact
+SEGMENT_KEYWORDS = {"EdTech": "edtech", "E-commerce": "commerce", "Healthcare": "health"}
+DEFAULT_SEGMENT = "General"
+
+DEFAULT_SUBJECT = "Connecting from Morphius AI"
+CONTACT_PAGE_SIZE_OPTIONS = [25, 50, 100]
+CONTACT_DISPLAY_FIELDS = ["name", "work_emails", "personal_emails", "phones", "source", "domain", "created_at"]
+CONTACT_CURSOR_BATCH_SIZE = 500
+DRAFT_PAGE_SIZE_OPTIONS = [10, 25, 50]
 
 
 # ===============================
 # HELPERS & CALLBACKS
 # ===============================
-def get_db_connection():
-    try:
-        client = MongoClient(MONGO_URI)
-        client.admin.command('ismaster')
-        db = client[MONGO_DB_NAME]
-        return client, db
-    except ConnectionFailure as e:
-        st.error(f"❌ Database Connection Error: {e}")
-        return None, None
-
-
-def fetch_cleaned_contacts(db):
-    try:
-        cursor = db.cleaned_contacts.find().sort('_id', -1)
-        df = pd.DataFrame(list(cursor))
-        if '_id' in df.columns:
-            df.rename(columns={'_id': 'mongo_id'}, inplace=True)
-        return df
-    except Exception as e:
-        st.warning(f"⚠ Could not fetch contacts. Error: {e}")
-        return pd.DataFrame()
-
-def fetch_unsubscribed_emails(db):
-    """Fetches emails from both unsubscribe collections."""
-    unsubscribed = set()
-    try:
-        # Fetch from manual unsubscribe link clicks
-        cursor1 = db.unsubscribed_emails.find({}, {'email': 1})
-        for doc in cursor1:
-            if 'email' in doc and isinstance(doc['email'], str):
-                unsubscribed.add(doc['email'].strip().lower())
-
-        # Fetch from follow-up unsubscribe list
-        cursor2 = db.unsubscribe_list.find({}, {'email': 1})
-        for doc in cursor2:
-            if 'email' in doc and isinstance(doc['email'], str):
-                unsubscribed.add(doc['email'].strip().lower())
-        
-        return unsubscribed
-    except Exception as e:
-        st.warning(f"⚠ Could not fetch unsubscribe lists. Error: {e}")
-        return set()
+def build_contact_query(sources=None, domain="", created_range=(), search="", exclude_ids=()):
+    """Mongo filter for the Step 1 contact selection; each condition is served by an index."""
+    query = {}
+    if sources:
+        query['source'] = {'$in': list(sources)}
+    domain = domain.strip().lower().removeprefix("www.")
+    if domain:
+        # Anchored prefixes stay index range scans; scraped domains may keep their "www."
+        query['domain'] = {'$in': [re.compile(f"^{re.escape(domain)}"), re.compile(f"^www\\.{re.escape(domain)}")]}
+    if len(created_range) == 2:
+        start, end = created_range
+        query['created_at'] = {
+            '$gte': datetime.datetime.combine(start, datetime.time.min, datetime.timezone.utc),
+            '$lt': datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min, datetime.timezone.utc)
+        }
+    if search.strip():
+        query['$text'] = {'$search': search.strip()}
+    if exclude_ids:
+        query['_id'] = {'$nin': list(exclude_ids)}
+    return query
+
+def fetch_contacts_page(db, query, page_size, before_id=None):
+    """
+    One page of matching contacts, newest first, paged by `_id` range like the cleaned data
+    viewer. Returns (DataFrame with a string `mongo_id` column, last _id on the page, whether more exist).
+    """
+    if before_id is not None:
+        query = {**query, '_id': {**query.get('_id', {}), '$lt': before_id}}
+    projection = {field: 1 for field in CONTACT_DISPLAY_FIELDS}
+    docs = list(db.cleaned_contacts.find(query, projection).sort('_id', -1).limit(page_size + 1))
+    has_next = len(docs) > page_size
+    docs = docs[:page_size]
+    df = pd.DataFrame(docs, columns=['_id'] + CONTACT_DISPLAY_FIELDS).rename(columns={'_id': 'mongo_id'})
+    df['mongo_id'] = df['mongo_id'].astype(str)
+    # Array fields (or legacy comma-joined strings) shown as one readable string
+    for col in LIST_FIELDS:
+        df[col] = df[col].map(join_values)
+    return df, (docs[-1]['_id'] if docs else None), has_next
+
+def iter_selected_contacts(db, query):
+    """Streams the chosen contacts from the database; "select all matching" is only resolved here."""
+    cursor = db.cleaned_contacts.find(query, {ALL_EMAILS_FIELD: 0, 'block_keys': 0}).sort('_id', -1).batch_size(CONTACT_CURSOR_BATCH_SIZE)
+    for doc in cursor:
+        doc['mongo_id'] = doc.pop('_id')
+        yield doc
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_contact_sources(_db):
+    return sorted(source for source in _db.cleaned_contacts.distinct('source') if source)
+
+def fetch_unsubscribed_contacts(db):
+    """
+    Joins both unsubscribe collections against cleaned_contacts on the server, through the
+    multikey `emails` index. Returns {contact _id: [its unsubscribed emails]}.
+    """
+    normalize_email = [
+        {'$match': {'email': {'$type': 'string'}}},
+        {'$project': {'_id': 0, 'email': {'$toLower': {'$trim': {'input': '$email'}}}}}
+    ]
+    pipeline = normalize_email + [
+        {'$unionWith': {'coll': 'unsubscribe_list', 'pipeline': normalize_email}},
+        {'$group': {'_id': '$email'}},
+        {'$lookup': {'from': 'cleaned_contacts', 'localField': '_id', 'foreignField': ALL_EMAILS_FIELD, 'as': 'contacts'}},
+        {'$unwind': '$contacts'},
+        {'$group': {'_id': '$contacts._id', 'emails': {'$addToSet': '$_id'}}}
+    ]
+    return {doc['_id']: sorted(doc['emails']) for doc in db.unsubscribed_emails.aggregate(pipeline)}
+
+def contact_collections_version(db):
+    """
+    Cheap change token for the contact and unsubscribe collections: document count and newest
+    _id of each, both answered from metadata and the _id index. Inserts and deletes change it.
+    """
+    version = []
+    for name in CONTACT_COLLECTIONS:
+        newest = db[name].find_one({}, {'_id': 1}, sort=[('_id', -1)])
+        version.append((name, db[name].estimated_document_count(), str(newest['_id']) if newest else None))
+    return tuple(version)
+
+@st.cache_data(ttl=CONTACT_SPLIT_TTL_SECONDS, show_spinner=False)
+def load_unsubscribed_contacts(_db, version):
+    """
+    The server-side unsubscribe join, cached until `version` changes.
+    Returns [(contact _id, name, [unsubscribed emails])].
+    """
+    unsubscribed_contacts = fetch_unsubscribed_contacts(_db)
+    names = {
+        doc['_id']: doc.get('name')
+        for doc in _db.cleaned_contacts.find({'_id': {'$in': list(unsubscribed_contacts)}}, {'name': 1})
+    }
+    return [(contact_id, names.get(contact_id) or 'N/A', emails) for contact_id, emails in unsubscribed_contacts.items()]
 
 def remove_email_from_unsubscribe_lists(db, email):
     """Removes an email from both unsubscribe collections."""
     try:
-        email_lower = email.strip().lower()
         # Case-insensitive removal
-        db.unsubscribed_emails.delete_many({'email': {'$regex': f'^{email_lower}$', '$options': 'i'}})
-        db.unsubscribe_list.delete_many({'email': {'$regex': f'^{email_lower}$', '$options': 'i'}})
+        db.unsubscribed_emails.delete_many({'email': exact_email_regex(email)})
+        db.unsubscribe_list.delete_many({'email': exact_email_regex(email)})
         return True
     except Exception as e:
         st.error(f"Failed to remove {email} from unsubscribe lists: {e}")
         return False
 
-def update_subject(index, email_id):
-    for i, email_draft in enumerate(st.session_state.edited_emails):
-        if email_draft['id'] == email_id:
-            widget_key = f"subject_{email_id}_{email_draft['regen_counter']}"
-            st.session_state.edited_emails[i]['subject'] = st.session_state[widget_key]
-            break
+def save_draft_field(db, draft_id, field, widget_key):
+    """Writes an edited subject or body straight to the draft store."""
+    update_draft(db, draft_id, **{field: st.session_state[widget_key]})
+
+
+def contact_for_draft(db, draft):
+    """The referenced contact, or the draft's own name and address if the contact was deleted."""
+    contact = db.cleaned_contacts.find_one({'_id': draft['contact_id']}, {ALL_EMAILS_FIELD: 0, 'block_keys': 0})
+    return contact or {'name': draft['name'], 'work_emails': [draft['to_email']]}
+
 
+def build_drafts_csv(db, campaign_id):
+    """CSV of a campaign's drafts, streamed from the store; only built when a download is requested."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["name", "to_email", "subject", "body", "status"])
+    for draft in iter_drafts(db, campaign_id, projection={"name": 1, "to_email": 1, "subject": 1, "body": 1, "status": 1}):
+        writer.writerow([draft.get("name"), draft.get("to_email"), draft.get("subject"), draft.get("body"), draft.get("status")])
+    return buffer.getvalue()
 
-def update_body(index, email_id):
-    for i, email_draft in enumerate(st.session_state.edited_emails):
-        if email_draft['id'] == email_id:
-            widget_key = f"body_{email_id}_{email_draft['regen_counter']}"
-            st.session_state.edited_emails[i]['body'] = st.session_state[widget_key]
-            break
+
+def start_campaign(db, drafts):
+    """Replaces this session's unsent drafts with a new campaign and shows its first page."""
+    owner = get_draft_owner()
+    discard_unsent_drafts(db, st.session_state.get('draft_campaign_id'), owner)
+    st.session_state.draft_campaign_id = create_campaign(db, drafts, owner)
+    st.session_state.draft_page = 0
 
 
 # ===============================
@@ -118,92 +221,339 @@ def get_fallback_template(domain, name, email=""):
     return append_unsubscribe_link(final_body, email)
 
 
-def generate_personalized_email_body(contact_details):
+def request_email_body(prompt):
+    """
+    Calls gpt-4o without touching the UI, so it can run on worker threads. Rate limits,
+    timeouts and 5xx errors are retried with jittered exponential backoff, honouring Retry-After.
+    """
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        try:
+            response = client_ai.chat.completions.create(
+                model=DRAFT_MODEL,
+                messages=[
+                    {"role": "system", "content": DRAFT_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=DRAFT_MAX_TOKENS, temperature=DRAFT_TEMPERATURE,
+            )
+            return response.choices[0].message.content.strip()
+        except RETRYABLE_OPENAI_ERRORS as e:
+            if attempt == OPENAI_MAX_RETRIES:
+                raise
+            response = getattr(e, "response", None)
+            retry_after = response.headers.get("retry-after") if response is not None else None
+            delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            time.sleep(delay)
+
+
+def draft_cache_key(prompt, contact_fields):
+    """Content address of a generation request: everything that changes the model's output."""
+    return "v1:" + json.dumps({
+        "model": DRAFT_MODEL, "temperature": DRAFT_TEMPERATURE, "max_tokens": DRAFT_MAX_TOKENS,
+        "system": DRAFT_SYSTEM_PROMPT, "prompt": prompt, "contact": contact_fields
+    }, sort_keys=True, default=str)
+
+
+def build_email_body(contact_details, use_cache=True):
+    """
+    Returns (body with unsubscribe link, error or None); falls back to a template when OpenAI
+    fails. Bodies come from DRAFT_CACHE when an identical request was answered before;
+    `use_cache=False` skips the lookup but still stores the new body.
+    """
     name = contact_details.get('name')
     domain = contact_details.get('domain', 'their industry')
     linkedin = contact_details.get('linkedin_url', '')
-    email = contact_details.get('work_emails') or contact_details.get('personal_emails', '')
+    email = primary_email(contact_details) or ""
     greeting = f"Dear Sir/Madam,"
     signature = "\n\nBest regards,\nD.Aasrith\nEmployee, Morphius AI\nhttps://www.morphius.in/"
-    try:
-        prompt = f"""
+    prompt = f"""
         Write a professional outreach email for {name} in the {domain} sector. LinkedIn: {linkedin}.
         Start with: "{greeting}" and end with "{signature}".
         """
-        response = client_ai.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a business development assistant. Only output the email body."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=300, temperature=0.75,
-        )
-        body = response.choices[0].message.content.strip()
-    except Exception as e:
-        st.warning(f"⚠ OpenAI API failed. Using fallback template. (Error: {e})")
-        body = get_fallback_template(domain, name, email)
+    cache_key = draft_cache_key(prompt, {"name": name, "domain": domain, "linkedin_url": linkedin, "email": email})
+    body = DRAFT_CACHE.get(cache_key) if use_cache else None
+    if body is None:
+        try:
+            body = request_email_body(prompt)
+        except Exception as e:
+            return get_fallback_template(domain, name, email), e
+        DRAFT_CACHE.set(cache_key, body)  # Fallback templates are never cached
 
     # Append unsubscribe link
-    return append_unsubscribe_link(body, email)
+    return append_unsubscribe_link(body, email), None
+
+
+def generate_personalized_email_body(contact_details, use_cache=True):
+    body, error = build_email_body(contact_details, use_cache)
+    if error:
+        st.warning(f"⚠ OpenAI API failed. Using fallback template. (Error: {error})")
+    return body
+
+
+def map_concurrently(fn, items, on_progress=None):
+    """
+    Runs `fn` over `items` on DRAFT_MAX_CONCURRENCY worker threads.
+    Returns the results in the same order as `items`, however the calls finish.
+    """
+    results = [None] * len(items)
+    if not items:
+        return results
+    with ThreadPoolExecutor(max_workers=DRAFT_MAX_CONCURRENCY) as executor:
+        futures = {executor.submit(fn, item): i for i, item in enumerate(items)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if on_progress:
+                on_progress(done, len(items))
+    return results
+
+
+def generate_email_bodies(contacts, on_progress=None):
+    """One personalized gpt-4o body per contact. Returns [(body, error)] in contact order."""
+    return map_concurrently(build_email_body, contacts, on_progress)
+
+
+# ===============================
+# SEGMENT TEMPLATES
+# ===============================
+def segment_for(domain):
+    """Same keyword buckets as get_fallback_template; everything else is the default segment."""
+    for segment, keyword in SEGMENT_KEYWORDS.items():
+        if keyword in str(domain).lower():
+            return segment
+    return DEFAULT_SEGMENT
+
+
+def build_segment_template(segment):
+    """
+    Returns (template, error or None): one reusable body for a whole segment with {name} and
+    {domain} placeholders. Cached like personalized bodies; no Streamlit calls.
+    """
+    greeting = f"Dear Sir/Madam,"
+    signature = "\n\nBest regards,\nD.Aasrith\nEmployee, Morphius AI\nhttps://www.morphius.in/"
+    prompt = f"""
+        Write a professional outreach email template for companies in the {segment} sector.
+        Write {{name}} wherever the recipient's name belongs and {{domain}} for their company; use no other placeholders.
+        Start with: "{greeting}" and end with "{signature}".
+        """
+    cache_key = draft_cache_key(prompt, {"segment": segment})
+    template = DRAFT_CACHE.get(cache_key)
+    if template is None:
+        try:
+            template = request_email_body(prompt)
+        except Exception as e:
+            return None, e
+        DRAFT_CACHE.set(cache_key, template)
+    return template, None
+
+
+def fill_segment_template(template, name, domain, to_email):
+    """Per-contact body from a segment template; contacts without a template get the fallback."""
+    if not template:
+        return get_fallback_template(domain or 'their industry', name, to_email)
+    # Plain replacement: the model's text may contain other braces
+    body = template.replace("{name}", str(name or "there")).replace("{domain}", str(domain or "your company"))
+    return append_unsubscribe_link(body, to_email)
+
+
+def plan_segments(recipients):
+    """Groups [(contact_id, name, domain, to_email)] by segment, in first-seen order."""
+    segments = {}
+    for recipient in recipients:
+        segments.setdefault(segment_for(recipient[2]), []).append(recipient)
+    return segments
 
 
 # ===============================
 # MAIN STREAMLIT APP
 # ===============================
-def main():
-    st.title("📧 Morphius AI — Email Automation")
+def render_segment_plan(db):
+    """Per-segment template preview and editing, then expansion into one draft per contact."""
+    plan = st.session_state.segment_plan
+    segments = plan_segments(plan["recipients"])
+    st.subheader(f"Segment Templates: {len(segments)} AI call(s) for {len(plan['recipients'])} contact(s)")
+    st.caption("Edit a template if needed. {name} and {domain} are filled in for each contact.")
+    for segment, recipients in segments.items():
+        with st.expander(f"{segment} — {len(recipients)} contact(s)", expanded=True):
+            if segment in plan["errors"]:
+                st.warning(f"⚠ OpenAI API failed for this segment; its contacts get the fallback template. (Error: {plan['errors'][segment]})")
+                continue
+            plan["templates"][segment] = st.text_area("Template", value=plan["templates"][segment], height=250, key=f"segment_template_{segment}")
+            _, sample_name, sample_domain, sample_email = recipients[0]
+            st.markdown(f"**Preview for {sample_name or 'N/A'} <{sample_email}>**")
+            st.text(fill_segment_template(plan["templates"][segment], sample_name, sample_domain, sample_email))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button(f"Expand into {len(plan['recipients'])} Drafts", use_container_width=True):
+            # Drafts keep the order the contacts were selected in
+            start_campaign(db, (
+                new_draft(contact_id, name, to_email, DEFAULT_SUBJECT,
+                          fill_segment_template(plan["templates"][segment_for(domain)], name, domain, to_email))
+                for contact_id, name, domain, to_email in plan["recipients"]
+            ))
+            del st.session_state.segment_plan
+            st.rerun()
+    with col2:
+        if st.button("Discard Templates", use_container_width=True):
+            del st.session_state.segment_plan
+            st.rerun()
+
+
+def render_contact_selection(db, unsubscribed_ids):
+    """
+    Filters run as a server-side query; only the match count and one page of matches reach
+    the browser. Picks made on each page are kept as ids in the session.
+    Returns (query resolving the selection, number of selected contacts).
+    """
+    if 'selected_contact_ids' not in st.session_state:
+        st.session_state.selected_contact_ids = set()
+    if 'contact_page_bounds' not in st.session_state:
+        st.session_state.contact_page_bounds = [None]
+    reset_pages = lambda: st.session_state.update(contact_page_bounds=[None])
+
+    f_col1, f_col2 = st.columns(2)
+    with f_col1:
+        sources = st.multiselect("Source", fetch_contact_sources(db), on_change=reset_pages)
+        domain = st.text_input("Domain starts with", on_change=reset_pages)
+    with f_col2:
+        search = st.text_input("Search name or domain", on_change=reset_pages)
+        created_range = st.date_input("Created between", value=(), on_change=reset_pages)
+    query = build_contact_query(sources, domain, created_range, search, exclude_ids=unsubscribed_ids)
+
+    total_matches = db.cleaned_contacts.count_documents(query)
+    selected_ids = st.session_state.selected_contact_ids
+    select_all = st.checkbox(f"Select all {total_matches} matching contacts", value=False, disabled=not total_matches)
+    if not total_matches:
+        st.info("No available contacts match these filters.")
+        return query, 0
+
+    page_size = st.selectbox("Contacts per page:", CONTACT_PAGE_SIZE_OPTIONS, index=0, on_change=reset_pages)
+    page_number = len(st.session_state.contact_page_bounds)
+    page_df, last_id, has_next = fetch_contacts_page(db, query, page_size, st.session_state.contact_page_bounds[-1])
+    page_df.insert(0, "Select", True if select_all else page_df['mongo_id'].isin(selected_ids))
+    edited_df = st.data_editor(
+        page_df, hide_index=True, column_order=["Select"] + CONTACT_DISPLAY_FIELDS,
+        disabled=select_all or CONTACT_DISPLAY_FIELDS, key=f"contact_editor_{page_number}_{select_all}_{hash(str(query))}"
+    )
+    if not select_all:
+        for mongo_id, is_selected in zip(edited_df['mongo_id'], edited_df['Select']):
+            if is_selected:
+                selected_ids.add(mongo_id)
+            else:
+                selected_ids.discard(mongo_id)
+    st.caption(f"{total_matches} matching contact(s) · {total_matches if select_all else len(selected_ids)} selected")
+
+    nav_prev, nav_info, nav_next = st.columns([1, 2, 1])
+    with nav_prev:
+        if st.button("⬅️ Previous Page", disabled=page_number == 1, use_container_width=True):
+            st.session_state.contact_page_bounds.pop()
+            st.rerun()
+    with nav_info:
+        if selected_ids and not select_all and st.button("Clear Selection", use_container_width=True):
+            selected_ids.clear()
+            st.rerun()
+    with nav_next:
+        if st.button("Next Page ➡️", disabled=not has_next, use_container_width=True):
+            st.session_state.contact_page_bounds.append(last_id)
+            st.rerun()
+
+    if select_all:
+        return query, total_matches
+    # Picks can span filters; contacts unsubscribed since they were picked are still excluded
+    return {'_id': {'$in': [ObjectId(mongo_id) for mongo_id in selected_ids], '$nin': list(unsubscribed_ids)}}, len(selected_ids)
 
-    if 'edited_emails' not in st.session_state:
-        st.session_state.edited_emails = []
 
-    client_mongo, db = get_db_connection()
-    if not client_mongo:
+def render_draft_review(db, campaign_id):
+    """One page of stored drafts at a time; edits are saved to the store as they are made."""
+    total = campaign_size(db, campaign_id)
+    if not total:
         return
 
-    # Fetch all contacts and unsubscribe lists
-    unsubscribed_emails_set = fetch_unsubscribed_emails(db)
-    all_contacts_df = fetch_cleaned_contacts(db)
+    st.header("Step 2: Review & Edit Drafts")
+    page_size = st.selectbox("Drafts per page:", DRAFT_PAGE_SIZE_OPTIONS, index=0,
+                             on_change=lambda: st.session_state.update(draft_page=0))
+    page_count = math.ceil(total / page_size)
+    page = min(st.session_state.get('draft_page', 0), page_count - 1)
+
+    for draft in fetch_drafts_page(db, campaign_id, page, page_size):
+        draft_id, regen_count = draft['_id'], draft['regen_count']
+        is_sent = draft['status'] != "draft"
+        with st.expander(f"Draft for {draft['name']} <{draft['to_email']}>", expanded=True):
+            if is_sent:
+                st.caption(f"Status: {draft['status']}; no longer editable.")
+            subject_key, body_key = f"subject_{draft_id}_{regen_count}", f"body_{draft_id}_{regen_count}"
+            st.text_input("Subject", value=draft['subject'], key=subject_key, disabled=is_sent,
+                          on_change=save_draft_field, args=(db, draft_id, "subject", subject_key))
+            st.text_area("Body", value=draft['body'], height=250, key=body_key, disabled=is_sent,
+                         on_change=save_draft_field, args=(db, draft_id, "body", body_key))
+
+            b_col1, b_col2 = st.columns(2)
+            with b_col1:
+                if st.button("🔄 Regenerate Body", key=f"regen_{draft_id}_{regen_count}", disabled=is_sent, use_container_width=True):
+                    # Always a fresh generation, which then replaces the cached body
+                    new_body = generate_personalized_email_body(contact_for_draft(db, draft), use_cache=False)
+                    replace_draft_body(db, draft_id, new_body)
+                    st.toast(f"Generated a new draft for {draft['name']}!")
+                    st.rerun()
+            with b_col2:
+                if st.button("✍ Clear & Write Manually", key=f"clear_{draft_id}_{regen_count}", disabled=is_sent, use_container_width=True):
+                    manual_template = f"Hi {draft.get('name', '')},\n\n\n\nBest regards,\nAasrith\nEmployee, Morphius AI\nhttps://www.morphius.in/"
+                    replace_draft_body(db, draft_id, append_unsubscribe_link(manual_template, draft['to_email']))
+                    st.toast(f"Cleared draft for {draft['name']}.")
+                    st.rerun()
+
+    nav_prev, nav_info, nav_next = st.columns([1, 2, 1])
+    with nav_prev:
+        if st.button("⬅️ Previous", disabled=page == 0, use_container_width=True):
+            st.session_state.draft_page = page - 1
+            st.rerun()
+    with nav_info:
+        st.markdown(f"<p style='text-align:center;'>Page {page + 1} of {page_count} · {total} drafts</p>", unsafe_allow_html=True)
+    with nav_next:
+        if st.button("Next ➡️", disabled=page >= page_count - 1, use_container_width=True):
+            st.session_state.draft_page = page + 1
+            st.rerun()
+
+    st.markdown("### 📥 Download All Drafts")
+    d_col1, d_col2 = st.columns(2)
+    with d_col1:
+        if st.button("Prepare Drafts CSV", use_container_width=True):
+            st.download_button("📥 Download Drafts as CSV", data=build_drafts_csv(db, campaign_id), file_name="morphius_email_drafts.csv", mime="text/csv", use_container_width=True)
+    with d_col2:
+        if st.button("🗑 Discard Unsent Drafts", use_container_width=True):
+            discard_unsent_drafts(db, campaign_id, get_draft_owner())
+            st.session_state.pop('draft_campaign_id', None)
+            st.rerun()
+
 
-    if all_contacts_df.empty:
-        st.info("No contacts found in the database.")
+def main():
+    st.title("📧 Morphius AI — Email Automation")
+
+    db = get_db()
+    if db is None:
         return
 
-    # Helper to check if a contact's emails are in the unsubscribe set
-    def is_email_subscribed(email_str):
-        if not isinstance(email_str, str) or not email_str.strip():
-            return True
-        emails = [e.strip().lower() for e in email_str.split(',')]
-        return not any(e in unsubscribed_emails_set for e in emails)
+    # Drafts live in the database; the session only remembers which campaign it is working on
+    if st.session_state.get('draft_campaign_id') is None:
+        st.session_state.draft_campaign_id = latest_open_campaign(db, get_draft_owner())
 
-    # Separate subscribed and unsubscribed contacts
-    subscribed_mask = all_contacts_df['work_emails'].apply(is_email_subscribed) & \
-                      all_contacts_df['personal_emails'].apply(is_email_subscribed)
-    
-    contacts_df = all_contacts_df[subscribed_mask].copy()
-    unsubscribed_df = all_contacts_df[~subscribed_mask].copy()
+    # Unsubscribed contacts from the server-side join, recomputed only when a contact or unsubscribe collection changes
+    try:
+        unsubscribed_contacts = load_unsubscribed_contacts(db, contact_collections_version(db))
+    except Exception as e:
+        st.warning(f"⚠ Could not fetch unsubscribe lists. Error: {e}")
+        return
 
     # Display unsubscribed contacts and resubscribe option
-    if not unsubscribed_df.empty:
-        with st.expander(f"ℹ️ {len(unsubscribed_df)} Unsubscribed Contacts"):
-            for _, row in unsubscribed_df.iterrows():
-                unsubscribed_emails_in_row = []
-                work_emails = row.get('work_emails', '')
-                personal_emails = row.get('personal_emails', '')
-
-                if isinstance(work_emails, str):
-                    for email in work_emails.split(','):
-                        if email.strip().lower() in unsubscribed_emails_set:
-                            unsubscribed_emails_in_row.append(email.strip())
-                
-                if isinstance(personal_emails, str):
-                    for email in personal_emails.split(','):
-                        if email.strip().lower() in unsubscribed_emails_set:
-                            unsubscribed_emails_in_row.append(email.strip())
-                
-                for email_to_resubscribe in set(unsubscribed_emails_in_row):
+    if unsubscribed_contacts:
+        with st.expander(f"ℹ️ {len(unsubscribed_contacts)} Unsubscribed Contacts"):
+            for _, name, emails in unsubscribed_contacts:
+                for email_to_resubscribe in emails:
                     col1, col2 = st.columns([3, 1])
                     with col1:
-                        st.write(f"**{row.get('name', 'N/A')}**: {email_to_resubscribe}")
+                        st.write(f"**{name}**: {email_to_resubscribe}")
                     with col2:
                         if st.button("Resubscribe", key=f"resub_{email_to_resubscribe}"):
                             if remove_email_from_unsubscribe_lists(db, email_to_resubscribe):
@@ -212,81 +562,80 @@ def main():
                             # Error is handled within the function
 
     st.header("Step 1: Select Contacts & Generate Drafts")
-    if contacts_df.empty:
-        st.info("No available contacts to display.")
-        client_mongo.close()
-        return
+    selection_query, selected_count = render_contact_selection(db, [contact_id for contact_id, _, _ in unsubscribed_contacts])
+
+    generation_mode = st.radio(
+        "Generation mode",
+        ["Personalized (one AI call per contact)", "Segment templates (one AI call per segment)"],
+        horizontal=True
+    )
+    segment_mode = generation_mode.startswith("Segment")
+    button_label = "Generate Segment Templates" if segment_mode else "Generate Drafts"
+
+    if st.button(f"{button_label} for {selected_count} Selected Contacts", disabled=not selected_count, use_container_width=True):
+        st.session_state.pop('segment_plan', None)
+        drafted_entities, drafted_emails = set(), set()
+        to_draft = []
+        messages = []  # Shown after the rerun below, which would otherwise wipe them
+        for row in iter_selected_contacts(db, selection_query):
+            to_email = primary_email(row)
+            if not to_email:
+                messages.append(f"⚠ Skipped '{row.get('name', 'Unknown')}' - no valid email.")
+                continue
+            # One email per canonical contact: the same company found by several sources shares it
+            entity_id = row.get('canonical_id')
+            if not isinstance(entity_id, ObjectId):
+                entity_id = row['mongo_id']
+            if entity_id in drafted_entities or to_email in drafted_emails:
+                messages.append(f"⚠ Skipped '{row.get('name', 'Unknown')}' - duplicate of a contact already drafted.")
+                continue
+            drafted_entities.add(entity_id)
+            drafted_emails.add(to_email)
+            to_draft.append((row['mongo_id'], row, to_email))
+
+        if segment_mode:
+            # The plan lives in the session until expanded, so it keeps only what a template needs
+            recipients = [(contact_id, row.get('name'), row.get('domain'), to_email) for contact_id, row, to_email in to_draft]
+            segments = plan_segments(recipients)
+            progress_bar = st.progress(0, text=f"Generating {len(segments)} segment templates...")
+            templates = map_concurrently(
+                build_segment_template, list(segments),
+                on_progress=lambda done, total: progress_bar.progress(done / total, text=f"Generated {done}/{total} templates...")
+            )
+            st.session_state.segment_plan = {
+                "recipients": recipients,
+                "templates": {segment: template for segment, (template, _) in zip(segments, templates)},
+                "errors": {segment: str(error) for segment, (_, error) in zip(segments, templates) if error}
+            }
+            st.session_state.draft_messages = messages
+            st.rerun()
+
+        progress_bar = st.progress(0, text=f"Generating {len(to_draft)} email drafts...")
+        DRAFT_CACHE.reset_stats()
+        bodies = generate_email_bodies(
+            [row for _, row, _ in to_draft],
+            on_progress=lambda done, total: progress_bar.progress(done / total, text=f"Generated {done}/{total} drafts...")
+        )
+        if DRAFT_CACHE.stats["hits"]:
+            st.toast(f"♻️ Reused {DRAFT_CACHE.stats['hits']} cached draft(s); no tokens spent on them.")
+        failed = [error for _, error in bodies if error]
+        if failed:
+            messages.append(f"⚠ OpenAI API failed for {len(failed)} draft(s). Using fallback template. (Error: {failed[0]})")
+        start_campaign(db, (
+            new_draft(contact_id, row.get('name'), to_email, DEFAULT_SUBJECT, body)
+            for (contact_id, row, to_email), (body, _) in zip(to_draft, bodies)
+        ))
+        st.session_state.draft_messages = messages
+        st.rerun()
 
-    display_df = contacts_df.copy()
-    if 'Select' not in display_df.columns:
-        display_df.insert(0, "Select", False)
+    for message in st.session_state.pop('draft_messages', []):
+        st.warning(message)
 
-    select_all = st.checkbox("Select All Contacts", value=False)
-    if select_all:
-        display_df['Select'] = True
-
-    edited_df = st.data_editor(display_df, hide_index=True, disabled=list(display_df.columns.drop("Select")), key="data_editor")
-    selected_rows = edited_df[edited_df['Select']]
-
-    if st.button(f"Generate Drafts for {len(selected_rows)} Selected Contacts", disabled=selected_rows.empty, use_container_width=True):
-        st.session_state.edited_emails = []
-        with st.spinner("Generating email drafts..."):
-            for i, row in selected_rows.iterrows():
-                to_email = None
-                work_email_val = row.get('work_emails')
-                if isinstance(work_email_val, str) and work_email_val.strip():
-                    to_email = work_email_val.split(',')[0].strip()
-                if not to_email:
-                    personal_email_val = row.get('personal_emails')
-                    if isinstance(personal_email_val, str) and personal_email_val.strip():
-                        to_email = personal_email_val.split(',')[0].strip()
-                if not to_email:
-                    st.warning(f"⚠ Skipped '{row.get('name', 'Unknown')}' - no valid email.")
-                    continue
-                body = generate_personalized_email_body(row)
-                st.session_state.edited_emails.append({
-                    "id": i, "name": row['name'], "to_email": to_email,
-                    "subject": "Connecting from Morphius AI", "body": body,
-                    "contact_details": row.to_dict(),
-                    "regen_counter": 0
-                })
-        st.rerun()
+    if st.session_state.get('segment_plan'):
+        render_segment_plan(db)
 
-    if st.session_state.edited_emails:
-        st.header("Step 2: Review & Edit Drafts")
-        for i, email_draft in enumerate(st.session_state.edited_emails):
-            unique_id = email_draft['id']
-            regen_count = email_draft['regen_counter']
-            with st.expander(f"Draft for {email_draft['name']} <{email_draft['to_email']}>", expanded=True):
-                st.text_input("Subject", value=email_draft['subject'],
-                              key=f"subject_{unique_id}_{regen_count}", on_change=update_subject, args=(i, unique_id))
-                st.text_area("Body", value=email_draft['body'], height=250,
-                             key=f"body_{unique_id}_{regen_count}", on_change=update_body, args=(i, unique_id))
-
-                b_col1, b_col2 = st.columns(2)
-                with b_col1:
-                    if st.button("🔄 Regenerate Body", key=f"regen_{unique_id}_{regen_count}", use_container_width=True):
-                        new_body = generate_personalized_email_body(email_draft['contact_details'])
-                        st.session_state.edited_emails[i]['body'] = new_body
-                        st.session_state.edited_emails[i]['regen_counter'] += 1
-                        st.toast(f"Generated a new draft for {email_draft['name']}!")
-                        st.rerun()
-                with b_col2:
-                    if st.button("✍ Clear & Write Manually", key=f"clear_{unique_id}_{regen_count}", use_container_width=True):
-                        manual_template = f"Hi {email_draft.get('name', '')},\n\n\n\nBest regards,\nAasrith\nEmployee, Morphius AI\nhttps://www.morphius.in/"
-                        manual_template = append_unsubscribe_link(manual_template, email_draft['to_email'])
-                        st.session_state.edited_emails[i]['body'] = manual_template
-                        st.session_state.edited_emails[i]['regen_counter'] += 1
-                        st.toast(f"Cleared draft for {email_draft['name']}.")
-                        st.rerun()
-
-        st.markdown("### 📥 Download All Drafts")
-        df_export = pd.DataFrame(st.session_state.edited_emails)[["name", "to_email", "subject", "body"]]
-        csv_buffer = StringIO()
-        df_export.to_csv(csv_buffer, index=False)
-        st.download_button("📥 Download Drafts as CSV", data=csv_buffer.getvalue(), file_name="morphius_email_drafts.csv", mime="text/csv", use_container_width=True)
-
-    client_mongo.close()
+    if st.session_state.draft_campaign_id is not None:
+        render_draft_review(db, st.session_state.draft_campaign_id)
 
 if __name__ == "__main__":
     main()